@@ -0,0 +1,368 @@
+"""Throughput benchmarks for the SherlockLogs pipeline.
+
+Usage:
+    python benchmark.py parse [--lines 10000000] [--noise 0.95] [--file path]
+    python benchmark.py parallel [--workers 1,2,4,8] [--lines ...] [--file path]
+    python benchmark.py detect [--events 1000000]
+    python benchmark.py load --url http://127.0.0.1:8000 [--file path] [--concurrency 4] [--duration 20]
+    python benchmark.py db [--writers 4] [--readers 8] [--duration 10] [--rows 5000]
+    python benchmark.py search [--events 1000000]
+    python benchmark.py encode [--lines 1000000]
+
+Synthetic logs are generated from demo_auth.txt: its SSH events are mixed
+with typical non-auth syslog noise and written once to a temp file, which is
+then reused by later runs with the same parameters.
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from events import EventTable, FAILED, SUCCESS
+from parser import StreamParser, analyze_findings, parse_log, parse_file_parallel, shutdown_pool
+
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+NOISE_TEMPLATES = [
+    "{ts} webserver CRON[{pid}]: pam_unix(cron:session): session opened for user root by (uid=0)",
+    "{ts} webserver CRON[{pid}]: (root) CMD (cd / && run-parts --report /etc/cron.hourly)",
+    "{ts} webserver systemd[1]: Started Session {pid} of user ubuntu.",
+    "{ts} webserver sshd[{pid}]: Connection closed by 198.51.100.{octet} port 5{pid} [preauth]",
+    "{ts} webserver sshd[{pid}]: pam_unix(sshd:session): session opened for user ubuntu by (uid=0)",
+    "{ts} webserver sshd[{pid}]: Received disconnect from 203.0.113.{octet} port 5{pid}:11: Bye Bye [preauth]",
+    "{ts} webserver kernel: [UFW BLOCK] IN=eth0 OUT= SRC=192.0.2.{octet} DST=10.0.0.5 LEN=40 PROTO=TCP",
+    "{ts} webserver sudo:   ubuntu : TTY=pts/0 ; PWD=/home/ubuntu ; USER=root ; COMMAND=/usr/bin/apt update",
+]
+
+MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+
+def _demo_event_bodies():
+    """Return demo_auth.txt lines with their syslog timestamp stripped."""
+    with open(os.path.join(APP_ROOT, 'demo_auth.txt'), 'r', encoding='utf-8') as f:
+        return [line.rstrip('\n')[16:] for line in f if line.strip()]
+
+
+def _syslog_ts(second):
+    day, rem = divmod(second, 86400)
+    month, day = divmod(day, 28)
+    return f"{MONTHS[month % 12]} {day + 1:2d} {rem // 3600:02d}:{rem // 60 % 60:02d}:{rem % 60:02d}"
+
+
+def generate_log(path, lines, noise=0.95, seed=1):
+    """Write a synthetic auth.log of `lines` lines; `noise` is the non-event fraction."""
+    rng = random.Random(seed)
+    events = _demo_event_bodies()
+    with open(path, 'w', encoding='utf-8') as f:
+        buf = []
+        for i in range(lines):
+            ts = _syslog_ts(i // 20)
+            if rng.random() < noise:
+                tpl = NOISE_TEMPLATES[i % len(NOISE_TEMPLATES)]
+                buf.append(tpl.format(ts=ts, pid=i % 99999, octet=i % 250))
+            else:
+                buf.append(f"{ts} {events[i % len(events)]}")
+            if len(buf) >= 10000:
+                f.write('\n'.join(buf) + '\n')
+                buf = []
+        if buf:
+            f.write('\n'.join(buf) + '\n')
+
+
+def synthetic_log(lines, noise):
+    """Return the path of a cached synthetic log, generating it on first use."""
+    path = os.path.join(tempfile.gettempdir(), f'sherlock_bench_{lines}_{noise}.log')
+    if not os.path.exists(path):
+        print(f"generating {lines:,} lines -> {path}")
+        generate_log(path, lines, noise)
+    return path
+
+
+def _report(name, lines, nbytes, seconds, events):
+    print(f"{name:<24} {seconds:8.2f}s  {lines / seconds:12,.0f} lines/s  "
+          f"{nbytes / seconds / 1e6:8.1f} MB/s  {events:,} events")
+
+
+def bench_parse(args):
+    path = args.file or synthetic_log(args.lines, args.noise)
+    size = os.path.getsize(path)
+
+    start = time.perf_counter()
+    with open(path, 'rb') as f:
+        result = parse_log(f)
+    elapsed = time.perf_counter() - start
+    with open(path, 'rb') as f:
+        lines = sum(1 for _ in f)
+    _report('parse_log(file)', lines, size, elapsed, len(result['events']))
+
+    start = time.perf_counter()
+    sp = StreamParser()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(1024 * 1024)
+            if not chunk:
+                break
+            sp.feed(chunk)
+    result = sp.close()
+    elapsed = time.perf_counter() - start
+    _report('StreamParser.feed', sp.lines_parsed, size, elapsed, len(result['events']))
+
+
+def bench_parallel(args):
+    path = args.file or synthetic_log(args.lines, args.noise)
+    size = os.path.getsize(path)
+    counts = [int(w) for w in args.workers.split(',')] if args.workers else \
+        sorted({1, 2, 4, os.cpu_count() or 1})
+    baseline = None
+    for workers in counts:
+        start = time.perf_counter()
+        result = parse_file_parallel(path, workers=workers)
+        elapsed = time.perf_counter() - start
+        shutdown_pool()
+        baseline = baseline or elapsed
+        print(f"workers={workers:<3} {elapsed:8.2f}s  {size / elapsed / 1e6:8.1f} MB/s  "
+              f"speedup x{baseline / elapsed:5.2f}  {len(result['events']):,} events")
+
+
+def synthetic_table(n, ips=5000, users=500, fail_ratio=0.7, seed=1):
+    """Build an EventTable of `n` events: a distributed brute force with scattered logins."""
+    rng = random.Random(seed)
+    table = EventTable(source=b'')
+    t = 1_700_000_000
+    for _ in range(n):
+        t += rng.randint(0, 1)
+        kind = FAILED if rng.random() < fail_ratio else SUCCESS
+        # a few hot IPs/users get most of the traffic, the rest is spread thin
+        ip = rng.randint(0, 20) if rng.random() < 0.5 else rng.randint(0, ips)
+        user = f"user{rng.randint(0, 10) if rng.random() < 0.5 else rng.randint(0, users)}"
+        table.append(kind, t, user, 0xC0000200 + ip, 0, 0)
+    return table
+
+
+def bench_detect(args):
+    table = synthetic_table(args.events)
+    start = time.perf_counter()
+    findings = analyze_findings({'events': table})
+    elapsed = time.perf_counter() - start
+    bursts = sum(1 for f in findings if f['type'] == 'brute_force')
+    print(f"analyze_findings {len(table):,} events  {elapsed:8.2f}s  {len(table) / elapsed:12,.0f} events/s  "
+          f"{bursts:,} bursts  {len(findings) - bursts:,} post-failure successes")
+
+
+def _percentiles(samples):
+    samples = sorted(samples)
+    if not samples:
+        return 'no samples'
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] * 1000
+    return f"n={len(samples):<5} p50={pick(0.50):7.1f}ms  p99={pick(0.99):7.1f}ms  max={samples[-1] * 1000:7.1f}ms"
+
+
+async def _probe_health(client, url, stop, samples, interval=0.02):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await client.get(f"{url}/health")
+        samples.append(time.perf_counter() - start)
+        await asyncio.sleep(interval)
+
+
+async def _post_analyses(client, url, path, stop, done):
+    while not stop.is_set():
+        with open(path, 'rb') as f:
+            r = await client.post(f"{url}/analyze", files={'logfile': (os.path.basename(path), f)})
+        r.raise_for_status()
+        done.append(r.elapsed.total_seconds())
+
+
+async def _load(args):
+    import httpx
+
+    path = args.file or synthetic_log(args.lines, args.noise)
+    phase = args.duration / 2
+    async with httpx.AsyncClient(timeout=None) as client:
+        idle = []
+        stop = asyncio.Event()
+        probe = asyncio.create_task(_probe_health(client, args.url, stop, idle))
+        await asyncio.sleep(phase)
+        stop.set()
+        await probe
+
+        busy, analyses = [], []
+        stop = asyncio.Event()
+        tasks = [asyncio.create_task(_post_analyses(client, args.url, path, stop, analyses))
+                 for _ in range(args.concurrency)]
+        probe = asyncio.create_task(_probe_health(client, args.url, stop, busy))
+        await asyncio.sleep(phase)
+        stop.set()
+        await asyncio.gather(probe, *tasks)
+
+    print(f"/health idle           {_percentiles(idle)}")
+    print(f"/health under analyze  {_percentiles(busy)}")
+    print(f"/analyze x{args.concurrency} concurrent  {_percentiles(analyses)}")
+
+
+def bench_load(args):
+    """/health latency while /analyze requests run against a live server."""
+    asyncio.run(_load(args))
+
+
+async def _db_client(call, stop, samples):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await call()
+        samples.append(time.perf_counter() - start)
+
+
+async def _db_load(args):
+    import db
+
+    narrative = 'Threat Level: HIGH ' * 100
+    recs = [{'title': 'Brute force', 'text': 'Block the source IP. ' * 20}] * 3
+    for _ in range(args.rows):
+        db.save_analysis('/tmp/bench.log', narrative, recs)
+
+    writes, reads, lookups = [], [], []
+    stop = asyncio.Event()
+    tasks = [asyncio.create_task(_db_client(lambda: db.asave_analysis('/tmp/bench.log', narrative, recs), stop, writes))
+             for _ in range(args.writers)]
+    tasks += [asyncio.create_task(_db_client(db.aget_analyses, stop, reads))
+              for _ in range(args.readers)]
+    tasks.append(asyncio.create_task(_db_client(lambda: db.aget_analysis_by_id(random.randint(1, args.rows)), stop, lookups)))
+    await asyncio.sleep(args.duration)
+    stop.set()
+    await asyncio.gather(*tasks)
+
+    for name, samples in (('save_analysis', writes), ('get_analyses', reads), ('get_analysis_by_id', lookups)):
+        print(f"{name:<20} {len(samples) / args.duration:8,.0f}/s  {_percentiles(samples)}")
+
+
+def bench_db(args):
+    """Concurrent writers and /history readers against a scratch database."""
+    import db
+
+    path = os.path.join(tempfile.mkdtemp(prefix='sherlock_db_'), 'bench.db')
+    db.init_db(path)
+    try:
+        asyncio.run(_db_load(args))
+    finally:
+        db.close_db()
+
+
+SEARCH_QUERIES = [
+    ('ip', {'ip_range': (0xCB00712D, 0xCB00712D)}),                      # 203.0.113.45
+    ('ip, no history', {'ip_range': (0xC6336414, 0xC6336414)}),          # 198.51.100.20
+    ('cidr /16', {'ip_range': (0xC6330000, 0xC633FFFF)}),                # 198.51.0.0/16
+    ('user', {'user': 'admin'}),
+    ('user + time range', {'user': 'root', 'start': 1_767_225_600, 'end': 1_767_312_000}),
+    ('text', {'text': 'invalid user oracle'}),
+    ('ip + text', {'ip_range': (0xCB00712D, 0xCB00712D), 'text': 'Accepted password'}),
+]
+
+
+def bench_search(args):
+    """Query latency over a store holding about --events historic events."""
+    import db
+
+    path = os.path.join(tempfile.mkdtemp(prefix='sherlock_db_'), 'search.db')
+    db.init_db(path)
+    parsed = parse_log(open(synthetic_log(args.lines, args.noise), 'rb'))
+    findings = analyze_findings(parsed)
+    copies = max(1, args.events // max(1, len(parsed['events'])))
+    start = time.perf_counter()
+    for i in range(copies):
+        db.save_analysis(f'/tmp/bench_{i}.log', 'narrative', [], parsed['events'], findings, parsed['summary'])
+    elapsed = time.perf_counter() - start
+    total = copies * len(parsed['events'])
+    print(f"stored {total:,} events in {copies} analyses  {elapsed:.1f}s  {total / elapsed:,.0f} events/s")
+
+    for name, query in SEARCH_QUERIES:
+        samples = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            result = db.search_events(**query)
+            samples.append(time.perf_counter() - start)
+        print(f"{name:<20} {_percentiles(samples)}  {result['total']:,} matches")
+    db.close_db()
+
+
+def bench_encode(args):
+    """Response encoding: jsonable_encoder + json versus orjson (main.encode_json)."""
+    import json
+    from fastapi.encoders import jsonable_encoder
+    from main import encode_json, format_events
+
+    parsed = parse_log(open(synthetic_log(args.lines, args.noise), 'rb'))
+    findings = analyze_findings(parsed)
+    table = parsed['events']
+    payloads = [
+        ('analysis result', {'findings': format_events(table), 'events_total': len(table),
+                             'threats': findings, 'summary': parsed['summary']}),
+        ('every event', {'findings': format_events(table, len(table)), 'threats': findings}),
+    ]
+    for name, payload in payloads:
+        start = time.perf_counter()
+        body = json.dumps(jsonable_encoder(payload), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        stdlib = time.perf_counter() - start
+        start = time.perf_counter()
+        fast = encode_json(payload)
+        elapsed = time.perf_counter() - start
+        print(f"{name:<16} {len(fast) / 1e6:8.1f} MB  jsonable_encoder+json {stdlib:7.3f}s  "
+              f"orjson {elapsed:7.3f}s  x{stdlib / elapsed:6.1f}  identical={body == fast}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('parse', help='single-process parser throughput')
+    p.add_argument('--lines', type=int, default=10_000_000)
+    p.add_argument('--noise', type=float, default=0.95)
+    p.add_argument('--file', help='benchmark an existing log instead of synthetic data')
+    p.set_defaults(func=bench_parse)
+
+    p = sub.add_parser('parallel', help='parse_file_parallel scaling by worker count')
+    p.add_argument('--workers', help='comma-separated worker counts (default: 1,2,4,cpu_count)')
+    p.add_argument('--lines', type=int, default=10_000_000)
+    p.add_argument('--noise', type=float, default=0.95)
+    p.add_argument('--file', help='benchmark an existing log instead of synthetic data')
+    p.set_defaults(func=bench_parallel)
+
+    p = sub.add_parser('detect', help='analyze_findings on synthetic events')
+    p.add_argument('--events', type=int, default=1_000_000)
+    p.set_defaults(func=bench_detect)
+
+    p = sub.add_parser('load', help='/health latency against a running server while analyses run')
+    p.add_argument('--url', default='http://127.0.0.1:8000')
+    p.add_argument('--file', help='log to upload (default: synthetic, see --lines)')
+    p.add_argument('--lines', type=int, default=200_000)
+    p.add_argument('--noise', type=float, default=0.95)
+    p.add_argument('--concurrency', type=int, default=4)
+    p.add_argument('--duration', type=float, default=20.0, help='seconds, split between idle and loaded phases')
+    p.set_defaults(func=bench_load)
+
+    p = sub.add_parser('db', help='analysis store under concurrent writers and readers')
+    p.add_argument('--writers', type=int, default=4)
+    p.add_argument('--readers', type=int, default=8)
+    p.add_argument('--duration', type=float, default=10.0)
+    p.add_argument('--rows', type=int, default=5000, help='rows to preload')
+    p.set_defaults(func=bench_db)
+
+    p = sub.add_parser('search', help='/search query latency over a large event store')
+    p.add_argument('--events', type=int, default=1_000_000, help='approximate events to store')
+    p.add_argument('--lines', type=int, default=1_000_000, help='synthetic log stored repeatedly')
+    p.add_argument('--noise', type=float, default=0.95)
+    p.add_argument('--repeat', type=int, default=20)
+    p.set_defaults(func=bench_search)
+
+    p = sub.add_parser('encode', help='JSON encoding of analysis results')
+    p.add_argument('--lines', type=int, default=1_000_000)
+    p.add_argument('--noise', type=float, default=0.95)
+    p.set_defaults(func=bench_encode)
+
+    args = ap.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""Transparent decompression of rotated and archived logs.
+
+Compression is recognized by magic bytes, never by file name, so an
+upload called auth.log that is really gzip still parses, and a rotated
+auth.log.2.gz is stored and read compressed: decompression streams
+straight into the parser without a temporary copy.
+
+gzip, bz2 and xz come with Python; zstd is used when the optional
+`zstandard` package is installed. A tar archive (plain or compressed)
+of a whole /var/log is recognized the same way; see iter_tar_members().
+
+Corrupt or truncated compressed data raises CorruptLogError, a
+ValueError, whichever decompressor it came from.
+"""
+import bz2
+import gzip
+import lzma
+import os
+import tarfile
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # optional: only needed for .zst logs
+    zstandard = None
+
+
+class CorruptLogError(ValueError):
+    pass
+
+
+# What the decompressors raise on bad input (BadGzipFile is an OSError)
+DECOMPRESSION_ERRORS = (EOFError, OSError, lzma.LZMAError, zlib.error) + \
+    ((zstandard.ZstdError,) if zstandard is not None else ())
+
+MAGIC = (
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'xz'),
+    (b'\x28\xb5\x2f\xfd', 'zstd'),
+)
+SUFFIXES = ('.gz', '.tgz', '.bz2', '.xz', '.zst', '.tar')
+# Enough to see a tar header's "ustar" magic at offset 257
+HEAD_SIZE = 512
+
+
+def detect_compression(head):
+    """'gzip', 'bz2', 'xz', 'zstd' or None for the first bytes of a stream."""
+    for magic, name in MAGIC:
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def is_tar(head):
+    return head[257:262] == b'ustar'
+
+
+def strip_suffixes(name):
+    """'auth.log.2.gz' -> 'auth.log.2', so format sniffing sees the real name."""
+    while name:
+        base, ext = os.path.splitext(name)
+        if ext.lower() not in SUFFIXES:
+            break
+        name = base
+    return name
+
+
+class _CheckedReader:
+    """Decompressing reader whose decoding errors become CorruptLogError."""
+
+    def __init__(self, reader, compression):
+        self._reader = reader
+        self.compression = compression
+
+    def read(self, size=-1):
+        try:
+            return self._reader.read(size)
+        except DECOMPRESSION_ERRORS as e:
+            raise CorruptLogError(f'Corrupt or truncated {self.compression} data: {e}') from None
+
+    def close(self):
+        self._reader.close()
+
+
+def decompress_stream(fileobj, compression):
+    """Binary file object yielding the decompressed bytes of `fileobj`."""
+    if compression is None:
+        return fileobj
+    if compression == 'gzip':
+        reader = gzip.GzipFile(fileobj=fileobj, mode='rb')
+    elif compression == 'bz2':
+        reader = bz2.BZ2File(fileobj, mode='rb')
+    elif compression == 'xz':
+        reader = lzma.LZMAFile(fileobj, mode='rb')
+    elif zstandard is None:
+        raise ValueError('zstd-compressed log, but the zstandard package is not installed')
+    else:
+        reader = zstandard.ZstdDecompressor().stream_reader(fileobj, read_across_frames=True)
+    return _CheckedReader(reader, compression)
+
+
+def open_log(path):
+    """Open a log on disk for reading decompressed bytes.
+
+    Returns (raw, reader, compression): `raw` is the file itself (its
+    tell() is the compressed position, for progress), `reader` yields the
+    decompressed bytes and is `raw` for a plain file. Close both.
+    """
+    raw = open(path, 'rb')
+    try:
+        compression = detect_compression(raw.read(HEAD_SIZE))
+        raw.seek(0)
+        return raw, decompress_stream(raw, compression), compression
+    except BaseException:
+        raw.close()
+        raise
+
+
+def read_head(path, size):
+    """First `size` decompressed bytes of a log on disk."""
+    raw, reader, _ = open_log(path)
+    try:
+        return reader.read(size)
+    finally:
+        if reader is not raw:
+            reader.close()
+        raw.close()
+
+
+def iter_tar_members(fileobj):
+    """Yield (name, size, file object) for every regular file in a (decompressed) tar stream.
+
+    The archive is read front to back in one pass (tar streams cannot
+    seek), so each member's file object must be read, or dropped, before
+    the next one is requested. Members are returned as stored: a rotated
+    auth.log.2.gz inside the archive stays compressed until it is parsed.
+    """
+    try:
+        with tarfile.open(fileobj=fileobj, mode='r|') as tar:
+            for member in tar:
+                if member.isfile():
+                    yield member.name, member.size, tar.extractfile(member)
+    except tarfile.TarError as e:
+        raise CorruptLogError(f'Corrupt or truncated tar archive: {e}') from None
@@ -0,0 +1,531 @@
+"""SQLite store for past analyses.
+
+Each analysis row keeps the narrative, recommendations and summary as
+JSON; its parsed events and detected findings go to the normalized
+`events` and `findings` tables (timestamps as epoch seconds, IPv4 as an
+integer), written with executemany in the same transaction, so a past
+analysis can be returned in full without re-parsing the log.
+
+Connections are pooled (up to DB_POOL_SIZE) and the database runs in WAL
+mode, so /history readers are never locked out by an analysis being
+written. Each pooled connection keeps its own prepared-statement cache,
+and the statements below are reused verbatim so they hit it.
+
+Every query has an async twin (a* functions) that runs on a dedicated
+executor with one thread per pooled connection, so the event loop never
+blocks on disk and never waits for a connection.
+"""
+import ast
+import asyncio
+import json
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+
+from events import KIND_STATUS, NO_TS, datetime_to_ts, format_ts, pack_ipv4, ts_to_datetime, unpack_ipv4
+
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '4'))
+DB_CACHE_KB = int(os.getenv('DB_CACHE_KB', '16384'))
+DB_BUSY_TIMEOUT = 5.0
+
+PRAGMAS = (
+    # WAL + NORMAL never corrupts; a power loss may only drop the last commits
+    'PRAGMA synchronous=NORMAL',
+    f'PRAGMA cache_size=-{DB_CACHE_KB}',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA foreign_keys=ON',
+)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS analyses (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    file_path TEXT,
+    narrative TEXT,
+    recs TEXT,
+    created_at TEXT
+);
+DROP INDEX IF EXISTS idx_analyses_created_at;
+CREATE INDEX IF NOT EXISTS idx_analyses_created_id ON analyses (created_at, id);
+
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    analysis_id INTEGER NOT NULL REFERENCES analyses (id) ON DELETE CASCADE,
+    ts INTEGER,
+    ip INTEGER NOT NULL,
+    user TEXT NOT NULL,
+    kind INTEGER NOT NULL,
+    raw TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_events_analysis ON events (analysis_id);
+CREATE INDEX IF NOT EXISTS idx_events_ip_ts ON events (ip, ts, analysis_id);
+CREATE INDEX IF NOT EXISTS idx_events_user_ts ON events (user, ts, analysis_id);
+CREATE INDEX IF NOT EXISTS idx_events_ts ON events (ts, analysis_id);
+
+CREATE TABLE IF NOT EXISTS findings (
+    id INTEGER PRIMARY KEY,
+    analysis_id INTEGER NOT NULL REFERENCES analyses (id) ON DELETE CASCADE,
+    type TEXT NOT NULL,
+    target_type TEXT,
+    target TEXT,
+    ip INTEGER,
+    user TEXT,
+    count INTEGER,
+    start_ts INTEGER,
+    end_ts INTEGER,
+    description TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_findings_analysis ON findings (analysis_id);
+'''
+
+# Full-text index over raw event lines (external content: the text lives in
+# `events`). Rows are indexed in bulk by save_analysis, which is about ten
+# times faster than a per-row insert trigger; deletes go through a trigger.
+FTS_SCHEMA = '''
+CREATE VIRTUAL TABLE IF NOT EXISTS events_fts USING fts5 (raw, content='events', content_rowid='id', columnsize=0);
+CREATE TRIGGER IF NOT EXISTS events_fts_delete AFTER DELETE ON events BEGIN
+    INSERT INTO events_fts (events_fts, rowid, raw) VALUES ('delete', old.id, old.raw);
+END;
+'''
+INDEX_EVENTS_FTS = 'INSERT INTO events_fts (rowid, raw) SELECT id, raw FROM events WHERE analysis_id = ?'
+
+# Columns added to `analyses` after the first release; created on startup if missing
+ANALYSIS_COLUMNS = {'summary': 'TEXT', 'log_sha256': 'TEXT'}
+
+INSERT_ANALYSIS = '''INSERT INTO analyses (file_path, narrative, recs, summary, log_sha256, created_at)
+VALUES (?, ?, ?, ?, ?, ?)'''
+INSERT_EVENT = 'INSERT INTO events (analysis_id, ts, ip, user, kind, raw) VALUES (?, ?, ?, ?, ?, ?)'
+INSERT_FINDING = '''INSERT INTO findings (analysis_id, type, target_type, target, ip, user, count, start_ts, end_ts, description)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'''
+SELECT_HISTORY_VERSION = 'SELECT COUNT(*), MAX(id) FROM analyses'
+SELECT_BY_ID = 'SELECT id, file_path, narrative, recs, summary, created_at FROM analyses WHERE id = ?'
+SELECT_EXISTS = 'SELECT 1 FROM analyses WHERE id = ?'
+# Two subqueries, so each is a single index probe rather than a scan of the analysis
+SELECT_EVENT_RANGE = '''SELECT (SELECT MIN(id) FROM events WHERE analysis_id = ?),
+(SELECT MAX(id) FROM events WHERE analysis_id = ?)'''
+SELECT_FINDINGS = '''SELECT type, target_type, target, ip, user, count, start_ts, end_ts, description
+FROM findings WHERE analysis_id = ? ORDER BY id'''
+
+# Projectable /history columns; `preview` is the start of the narrative for list views
+HISTORY_FIELDS = {
+    'id': 'id',
+    'file_path': 'file_path',
+    'created_at': 'created_at',
+    'narrative': 'narrative',
+    'preview': 'substr(narrative, 1, 100) AS preview',
+    'recs': 'recs',
+    'summary': 'summary',
+}
+DEFAULT_HISTORY_FIELDS = ('id', 'file_path', 'narrative', 'recs', 'created_at')
+HISTORY_MAX_LIMIT = 200
+
+SEARCH_LIMIT = 100
+SEARCH_MAX_LIMIT = 1000
+
+# Events returned with an analysis; the rest are paged through get_events()
+EVENTS_PAGE_SIZE = 100
+EVENTS_MAX_LIMIT = 1000
+
+_db_path = None
+_has_fts = False
+_pool = None
+_pool_lock = threading.Lock()
+_created = 0
+_executor = None
+
+
+def _connect():
+    conn = sqlite3.connect(_db_path, timeout=DB_BUSY_TIMEOUT, check_same_thread=False, cached_statements=64)
+    conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+@contextmanager
+def _connection():
+    """Borrow a pooled connection, opening one if the pool is not full yet."""
+    global _created
+    try:
+        conn = _pool.get_nowait()
+    except queue.Empty:
+        with _pool_lock:
+            grow = _created < DB_POOL_SIZE
+            if grow:
+                _created += 1
+        conn = _connect() if grow else _pool.get()
+    try:
+        yield conn
+    finally:
+        _pool.put(conn)
+
+
+def init_db(path):
+    global _db_path, _pool, _created, _has_fts
+    close_db()
+    _db_path = path
+    _pool = queue.LifoQueue()
+    _created = 0
+    with _connection() as conn:
+        # journal_mode is persistent, so set it once here rather than per connection
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(SCHEMA)
+        existing = {row['name'] for row in conn.execute('PRAGMA table_info(analyses)')}
+        for name, decl in ANALYSIS_COLUMNS.items():
+            if name not in existing:
+                conn.execute(f'ALTER TABLE analyses ADD COLUMN {name} {decl}')
+        _has_fts = _init_fts(conn)
+
+
+def _init_fts(conn):
+    """Create the FTS5 index (backfilling it on an existing database); False if FTS5 is unavailable."""
+    fresh = not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'events_fts'").fetchone()
+    try:
+        conn.executescript(FTS_SCHEMA)
+    except sqlite3.OperationalError as e:
+        print(f"Full-text search disabled: {e}")
+        return False
+    if fresh:
+        with conn:
+            conn.execute("INSERT INTO events_fts (events_fts) VALUES ('rebuild')")
+    return True
+
+
+def close_db():
+    """Close every pooled connection and the executor (app shutdown)."""
+    global _created, _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+    while _pool is not None:
+        try:
+            _pool.get_nowait().close()
+        except queue.Empty:
+            break
+    _created = 0
+
+
+def _epoch(value):
+    return None if value is None else datetime_to_ts(value)
+
+
+def _event_rows(analysis_id, table):
+    for i, raw in zip(range(len(table)), table.iter_raw(range(len(table)))):
+        ts = table.ts[i]
+        yield analysis_id, None if ts == NO_TS else ts, table.ip[i], table.user(i), table.kind[i], raw
+
+
+def _finding_rows(analysis_id, findings):
+    for f in findings:
+        if f['type'] == 'post_failure_success':
+            yield (analysis_id, f['type'], None, None, pack_ipv4(f['ip']), f['user'], f['fail_count'],
+                   _epoch(f['success_ts']), None, f['description'])
+        else:
+            yield (analysis_id, f['type'], f.get('target_type'), f.get('target'), None, None, f.get('count'),
+                   _epoch(f.get('start_ts')), _epoch(f.get('end_ts')), f['description'])
+
+
+def _finding_from_row(row):
+    if row['type'] == 'post_failure_success':
+        return {
+            'type': row['type'],
+            'ip': unpack_ipv4(row['ip']),
+            'user': row['user'],
+            'success_ts': ts_to_datetime(row['start_ts']),
+            'fail_count': row['count'],
+            'description': row['description'],
+        }
+    return {
+        'type': row['type'],
+        'target': row['target'],
+        'target_type': row['target_type'],
+        'count': row['count'],
+        'start_ts': None if row['start_ts'] is None else ts_to_datetime(row['start_ts']),
+        'end_ts': None if row['end_ts'] is None else ts_to_datetime(row['end_ts']),
+        'description': row['description'],
+    }
+
+
+def _event_from_row(row):
+    return {
+        'timestamp': 'N/A' if row['ts'] is None else format_ts(row['ts']),
+        'user': row['user'],
+        'ip': unpack_ipv4(row['ip']),
+        'status': KIND_STATUS.get(row['kind'], 'Accepted'),
+        'raw': row['raw'],
+    }
+
+
+def _page_event_from_row(row, first_id):
+    event = {
+        'index': row['id'] - first_id,
+        'timestamp': 'N/A' if row['ts'] is None else format_ts(row['ts']),
+        'user': row['user'],
+        'ip': unpack_ipv4(row['ip']),
+        'status': KIND_STATUS.get(row['kind'], 'Accepted'),
+    }
+    if 'raw' in row.keys():
+        event['raw'] = row['raw']
+    return event
+
+
+def _decode_recs(text):
+    if not text:
+        return []
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    try:
+        return ast.literal_eval(text)  # rows written before recs were stored as JSON
+    except (ValueError, SyntaxError):
+        return []
+
+
+def save_analysis(file_path, narrative, recs, events=None, findings=None, summary=None, log_sha256=None):
+    """Store an analysis with its events (an EventTable) and findings in one transaction.
+
+    `log_sha256` names the content-addressed upload the analysis was made from.
+    """
+    with _connection() as conn:
+        with conn:
+            cur = conn.execute(INSERT_ANALYSIS, (file_path, narrative, json.dumps(recs),
+                                                 json.dumps(summary) if summary is not None else None,
+                                                 log_sha256, datetime.utcnow().isoformat()))
+            analysis_id = cur.lastrowid
+            if events is not None:
+                conn.executemany(INSERT_EVENT, _event_rows(analysis_id, events))
+                if _has_fts:
+                    conn.execute(INDEX_EVENTS_FTS, (analysis_id,))
+            if findings:
+                conn.executemany(INSERT_FINDING, _finding_rows(analysis_id, findings))
+        return analysis_id
+
+
+def history_version():
+    """(row count, max id) of analyses: rows are never updated, so this changes whenever history does."""
+    with _connection() as conn:
+        return tuple(conn.execute(SELECT_HISTORY_VERSION).fetchone())
+
+
+def get_analyses(limit=50, before=None, fields=DEFAULT_HISTORY_FIELDS):
+    """One page of past analyses, newest first.
+
+    Keyset pagination on (created_at, id): pass the last row's pair as
+    `before` for the next page. `fields` picks columns from HISTORY_FIELDS;
+    id and created_at are always included since the cursor needs them.
+    """
+    fields = ['id', 'created_at'] + [f for f in fields if f not in ('id', 'created_at')]
+    columns = ', '.join(HISTORY_FIELDS[f] for f in fields)
+    limit = max(1, min(limit, HISTORY_MAX_LIMIT))
+    with _connection() as conn:
+        if before is None:
+            rows = conn.execute(f'SELECT {columns} FROM analyses ORDER BY created_at DESC, id DESC LIMIT ?',
+                                (limit,)).fetchall()
+        else:
+            rows = conn.execute(f'SELECT {columns} FROM analyses WHERE (created_at, id) < (?, ?) '
+                                f'ORDER BY created_at DESC, id DESC LIMIT ?', (*before, limit)).fetchall()
+    analyses = [dict(row) for row in rows]
+    for a in analyses:
+        if 'recs' in a:
+            a['recs'] = _decode_recs(a['recs'])
+        if 'summary' in a:
+            a['summary'] = json.loads(a['summary']) if a['summary'] else None
+    return analyses
+
+
+def get_analysis_by_id(analysis_id):
+    """Retrieve a single analysis by ID, with its threats and first page of events ('findings')."""
+    with _connection() as conn:
+        row = conn.execute(SELECT_BY_ID, (analysis_id,)).fetchone()
+        if not row:
+            return None
+        analysis = dict(row)
+        page = _events_page(conn, analysis_id, 0, EVENTS_PAGE_SIZE)
+        analysis['findings'] = page['events']
+        analysis['events_total'] = page['total']
+        analysis['threats'] = [_finding_from_row(r) for r in conn.execute(SELECT_FINDINGS, (analysis_id,))]
+    analysis['recs'] = _decode_recs(analysis['recs'])
+    analysis['summary'] = json.loads(analysis['summary']) if analysis['summary'] else None
+    return analysis
+
+
+def _event_filters(kind, ip_range):
+    clauses, params = [], []
+    if kind is not None:
+        clauses.append('kind = ?')
+        params.append(kind)
+    if ip_range is not None and ip_range[0] == ip_range[1]:
+        clauses.append('ip = ?')
+        params.append(ip_range[0])
+    elif ip_range is not None:
+        clauses.append('ip BETWEEN ? AND ?')
+        params.extend(ip_range)
+    return clauses, params
+
+
+def _events_page(conn, analysis_id, offset, limit, kind=None, ip_range=None, raw=False):
+    # An analysis's events are inserted by one executemany in one
+    # transaction, so their ids are consecutive: an event's index is its id
+    # minus the first, and an unfiltered page is an id range on the primary key.
+    first_id, last_id = conn.execute(SELECT_EVENT_RANGE, (analysis_id, analysis_id)).fetchone()
+    if first_id is None:
+        return {'total': 0, 'offset': offset, 'limit': limit, 'events': []}
+    columns = 'id, ts, ip, user, kind, raw' if raw else 'id, ts, ip, user, kind'
+    clauses, params = _event_filters(kind, ip_range)
+
+    if not clauses:
+        total = last_id - first_id + 1
+        rows = conn.execute(f'SELECT {columns} FROM events WHERE id >= ? AND id <= ? ORDER BY id LIMIT ?',
+                            (first_id + offset, last_id, limit)).fetchall()
+    else:
+        where = ' AND '.join(['analysis_id = ?'] + clauses)
+        params = (analysis_id, *params)
+        total = conn.execute(f'SELECT COUNT(*) FROM events WHERE {where}', params).fetchone()[0]
+        rows = conn.execute(f'SELECT {columns} FROM events WHERE {where} ORDER BY id LIMIT ? OFFSET ?',
+                            (*params, limit, offset)).fetchall()
+    return {'total': total, 'offset': offset, 'limit': limit,
+            'events': [_page_event_from_row(r, first_id) for r in rows]}
+
+
+def get_events(analysis_id, offset=0, limit=EVENTS_PAGE_SIZE, kind=None, ip_range=None, raw=False):
+    """One page of an analysis's events in log order, or None for an unknown analysis.
+
+    `kind` (FAILED/SUCCESS/LOCAL) and `ip_range` (inclusive packed IPv4 range)
+    filter the events; `total` counts all that match. Each event carries
+    its `index` in the analysis, and its raw line only when `raw` is set,
+    so a table can page through millions of events and fetch the lines
+    it shows (offset=index, limit=1, raw=True) on demand.
+    """
+    offset = max(0, offset)
+    limit = max(1, min(limit, EVENTS_MAX_LIMIT))
+    with _connection() as conn:
+        if conn.execute(SELECT_EXISTS, (analysis_id,)).fetchone() is None:
+            return None
+        return _events_page(conn, analysis_id, offset, limit, kind, ip_range, raw)
+
+
+def get_event_batch(analysis_id, start=0, limit=EVENTS_MAX_LIMIT, kind=None, ip_range=None, raw=False):
+    """Up to `limit` matching events with index >= `start`, or None for an unknown analysis.
+
+    Keyset counterpart of get_events() for reading a whole analysis:
+    continue from the last event's index + 1 until a batch comes back empty.
+    """
+    limit = max(1, min(limit, EVENTS_MAX_LIMIT))
+    with _connection() as conn:
+        if conn.execute(SELECT_EXISTS, (analysis_id,)).fetchone() is None:
+            return None
+        first_id, last_id = conn.execute(SELECT_EVENT_RANGE, (analysis_id, analysis_id)).fetchone()
+        if first_id is None:
+            return []
+        columns = 'id, ts, ip, user, kind, raw' if raw else 'id, ts, ip, user, kind'
+        clauses, params = _event_filters(kind, ip_range)
+        where = ' AND '.join(['id >= ?', 'id <= ?'] + clauses)
+        rows = conn.execute(f'SELECT {columns} FROM events WHERE {where} ORDER BY id LIMIT ?',
+                            (first_id + max(0, start), last_id, *params, limit)).fetchall()
+    return [_page_event_from_row(r, first_id) for r in rows]
+
+
+def search_available():
+    return _has_fts
+
+
+def search_events(ip_range=None, user=None, start=None, end=None, text=None, limit=SEARCH_LIMIT):
+    """Events across all stored analyses matching every given filter.
+
+    `ip_range` is an inclusive (low, high) packed IPv4 range (one address or
+    a CIDR block), `start`/`end` are epoch seconds and `text` is matched as
+    a phrase against raw lines with FTS5. Returns the newest `limit`
+    matching events plus, per analysis, how many events matched and when.
+    """
+    clauses, params = [], []
+    if ip_range is not None and ip_range[0] == ip_range[1]:
+        clauses.append('e.ip = ?')  # equality lets the (ip, ts) index also give the ts order
+        params.append(ip_range[0])
+    elif ip_range is not None:
+        clauses.append('e.ip BETWEEN ? AND ?')
+        params.extend(ip_range)
+    if user is not None:
+        clauses.append('e.user = ?')
+        params.append(user)
+    if start is not None:
+        clauses.append('e.ts >= ?')
+        params.append(start)
+    if end is not None:
+        clauses.append('e.ts <= ?')
+        params.append(end)
+    if text:
+        if not _has_fts:
+            raise ValueError('full-text search is not available in this SQLite build')
+        clauses.append('e.id IN (SELECT rowid FROM events_fts WHERE events_fts MATCH ?)')
+        params.append('"' + text.replace('"', '""') + '"')
+    where = ' AND '.join(clauses) or '1'
+    limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+
+    # Both queries filter through the covering (ip|user|ts, ts, analysis_id)
+    # indexes; full rows are only read for the `limit` events returned. The
+    # unary + keeps the planner from scanning idx_events_analysis instead.
+    with _connection() as conn:
+        rows = conn.execute(
+            f'SELECT analysis_id, ts, ip, user, kind, raw FROM events WHERE id IN '
+            f'(SELECT e.id FROM events e WHERE {where} ORDER BY e.ts DESC LIMIT ?) '
+            f'ORDER BY ts DESC', (*params, limit)).fetchall()
+        per_analysis = conn.execute(
+            f'SELECT m.analysis_id, a.file_path, a.created_at, m.events, m.first_ts, m.last_ts FROM '
+            f'(SELECT e.analysis_id, COUNT(*) AS events, MIN(e.ts) AS first_ts, MAX(e.ts) AS last_ts '
+            f'FROM events e WHERE {where} GROUP BY +e.analysis_id) m '
+            f'JOIN analyses a ON a.id = m.analysis_id ORDER BY a.created_at DESC LIMIT ?',
+            (*params, SEARCH_MAX_LIMIT)).fetchall()
+
+    events = []
+    for row in rows:
+        event = _event_from_row(row)
+        event['analysis_id'] = row['analysis_id']
+        events.append(event)
+    analyses = [{
+        'analysis_id': row['analysis_id'],
+        'file_path': row['file_path'],
+        'created_at': row['created_at'],
+        'events': row['events'],
+        'first_ts': 'N/A' if row['first_ts'] is None else format_ts(row['first_ts']),
+        'last_ts': 'N/A' if row['last_ts'] is None else format_ts(row['last_ts']),
+    } for row in per_analysis]
+    return {'total': sum(a['events'] for a in analyses), 'analyses': analyses, 'events': events}
+
+
+async def _run(fn, *args):
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(DB_POOL_SIZE, thread_name_prefix='db')
+    return await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
+
+
+async def asave_analysis(file_path, narrative, recs, events=None, findings=None, summary=None, log_sha256=None):
+    return await _run(save_analysis, file_path, narrative, recs, events, findings, summary, log_sha256)
+
+
+async def ahistory_version():
+    return await _run(history_version)
+
+
+async def aget_analyses(limit=50, before=None, fields=DEFAULT_HISTORY_FIELDS):
+    return await _run(get_analyses, limit, before, fields)
+
+
+async def aget_analysis_by_id(analysis_id):
+    return await _run(get_analysis_by_id, analysis_id)
+
+
+async def aget_events(analysis_id, offset=0, limit=EVENTS_PAGE_SIZE, kind=None, ip_range=None, raw=False):
+    return await _run(get_events, analysis_id, offset, limit, kind, ip_range, raw)
+
+
+async def aget_event_batch(analysis_id, start=0, limit=EVENTS_MAX_LIMIT, kind=None, ip_range=None, raw=False):
+    return await _run(get_event_batch, analysis_id, start, limit, kind, ip_range, raw)
+
+
+async def asearch_events(ip_range=None, user=None, start=None, end=None, text=None, limit=SEARCH_LIMIT):
+    return await _run(search_events, ip_range, user, start, end, text, limit)
@@ -0,0 +1,175 @@
+"""Sliding-window detectors over an EventTable.
+
+Detector consumes table rows in timestamp order and keeps, per source IP
+and per user, a deque of the failed-login timestamps still inside the
+window. Each event costs amortized O(1), so a whole analysis is
+O(n log n) including the initial sort.
+
+- brute_force: a burst opens when a key reaches `failed_threshold` failures
+  within `window_minutes`, extends while every new failure still has that
+  many in its window, and is reported once it closes, with its full span
+  and count. Every burst is reported, not just the first per key, and no
+  failure is counted in two bursts.
+- post_failure_success: a successful login from an IP that has failed
+  logins within the preceding window.
+
+Local events (NO_IP) only count towards their user's window.
+"""
+from bisect import bisect_right, insort
+from collections import deque
+import heapq
+
+from events import FAILED, SUCCESS, NO_IP, NO_TS, ts_to_datetime, unpack_ipv4
+
+
+class _Burst:
+    __slots__ = ('start', 'end', 'count')
+
+    def __init__(self, start, end, count):
+        self.start = start
+        self.end = end
+        self.count = count
+
+
+class Detector:
+    """Incremental brute-force / post-failure-success detector."""
+
+    def __init__(self, table, failed_threshold=5, window_minutes=5):
+        self.table = table
+        self.threshold = failed_threshold
+        self.window = window_minutes * 60
+        # key -> deque of failure timestamps in the current window;
+        # keys are ('ip', packed_ip) and ('user', name): names rather than
+        # table user ids, so a follower can drop its interned users
+        self._fails = {}
+        self._open = {}
+        # key -> end of the burst that closed while its failures were still
+        # in the window; a new burst only counts failures after it
+        self._closed = {}
+        # (deadline, key, end) for open bursts, lazily invalidated
+        self._deadlines = []
+        self.now = None
+        self._pruned = None
+
+    def add(self, i):
+        """Feed row `i` of the table; returns findings completed by it."""
+        t = self.table.ts[i]
+        if t == NO_TS:
+            return []
+        if self.now is None or t > self.now:
+            self.now = t
+        kind = self.table.kind[i]
+        ip = self.table.ip[i]
+        found = []
+        if kind & FAILED:
+            if ip != NO_IP:
+                self._add_failure(('ip', ip), t, found)
+            self._add_failure(('user', self.table.user(i)), t, found)
+        elif kind & SUCCESS and ip != NO_IP:
+            fails = self._fails.get(('ip', ip))
+            if fails:
+                self._expire(fails, t)
+                recent = 0
+                if fails:
+                    recent = len(fails) if fails[-1] <= t else bisect_right(fails, t)
+                if recent:
+                    found.append(self._post_failure_finding(i, recent))
+        return found
+
+    def poll(self, now=None):
+        """Close bursts whose window has passed by `now` (default: latest event time)."""
+        now = self.now if now is None else now
+        found = []
+        if now is None:
+            return found
+        while self._deadlines and self._deadlines[0][0] < now:
+            _, key, end = heapq.heappop(self._deadlines)
+            burst = self._open.get(key)
+            if burst is not None and burst.end == end:
+                del self._open[key]
+                found.append(self._burst_finding(key, burst))
+                if not self._fails.get(key):
+                    self._fails.pop(key, None)
+        # Forget keys whose newest failure has left the window, at most once
+        # per window, so a long-running follower does not keep every IP and
+        # user that ever failed
+        if self._pruned is None or now - self._pruned >= self.window:
+            self._pruned = now
+            limit = now - self.window
+            stale = [key for key, fails in self._fails.items()
+                     if (not fails or fails[-1] < limit) and key not in self._open]
+            for key in stale:
+                del self._fails[key]
+            for key in [key for key, end in self._closed.items() if end < limit]:
+                del self._closed[key]
+        return found
+
+    def flush(self):
+        """Close every open burst (end of input)."""
+        found = [self._burst_finding(key, burst) for key, burst in self._open.items()]
+        self._open.clear()
+        self._deadlines = []
+        return found
+
+    def _expire(self, fails, t):
+        limit = t - self.window
+        while fails and fails[0] < limit:
+            fails.popleft()
+
+    def _add_failure(self, key, t, found):
+        fails = self._fails.get(key)
+        if fails is None:
+            fails = self._fails[key] = deque()
+        self._expire(fails, t)
+        if fails and t < fails[-1]:
+            insort(fails, t)  # slightly out-of-order input
+        else:
+            fails.append(t)
+
+        burst = self._open.get(key)
+        if burst is not None:
+            if len(fails) >= self.threshold:
+                burst.end = max(burst.end, t)
+                burst.count += 1
+                heapq.heappush(self._deadlines, (burst.end + self.window, key, burst.end))
+                return
+            del self._open[key]
+            self._closed[key] = burst.end
+            found.append(self._burst_finding(key, burst))
+        first = 0
+        closed = self._closed.get(key)
+        if closed is not None and fails[0] <= closed:
+            first = bisect_right(fails, closed)
+        if len(fails) - first >= self.threshold:
+            burst = self._open[key] = _Burst(fails[first], t, len(fails) - first)
+            heapq.heappush(self._deadlines, (t + self.window, key, t))
+
+    def _label(self, key):
+        kind, value = key
+        if kind == 'ip':
+            return unpack_ipv4(value)
+        return value
+
+    def _burst_finding(self, key, burst):
+        target = self._label(key)
+        start_ts, end_ts = ts_to_datetime(burst.start), ts_to_datetime(burst.end)
+        return {
+            'type': 'brute_force',
+            'target': target,
+            'target_type': key[0],
+            'count': burst.count,
+            'start_ts': start_ts,
+            'end_ts': end_ts,
+            'description': f"{burst.count} failed logins for {key[0]} {target} between {start_ts} and {end_ts}"
+        }
+
+    def _post_failure_finding(self, i, fail_count):
+        ip, user, success_ts = self.table.ip_str(i), self.table.user(i), self.table.timestamp(i)
+        return {
+            'type': 'post_failure_success',
+            'ip': ip,
+            'user': user,
+            'success_ts': success_ts,
+            'fail_count': fail_count,
+            'description': f"Successful login for {user} from {ip} at {success_ts} after {fail_count} recent failures"
+        }
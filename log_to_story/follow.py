@@ -0,0 +1,203 @@
+"""Follow a growing auth.log and report findings as they appear.
+
+LogFollower keeps a byte offset into the file, one StreamParser and one
+sliding-window Detector for the whole session, so each poll only reads
+and analyzes the bytes appended since the last one. Rows are dropped from
+the event table as soon as the detector has seen them, so memory is
+bounded by the open windows, not by how long the log has been followed.
+
+Rotation (the path now names a different inode) is handled by draining
+the old file and continuing at the start of the new one; truncation in
+place (copytruncate) restarts at offset 0. With `state_path`, the offset
+is saved after every poll and a restart resumes where it left off.
+
+Usage:
+    python follow.py /var/log/auth.log [--from-start] [--state follow.json] [--interval 1] [--json]
+"""
+import argparse
+import json
+import os
+import time
+
+from detectors import Detector
+from events import FAILED, SUCCESS
+from formats import detect_file_formats
+from parser import StreamParser
+
+READ_SIZE = 1024 * 1024
+
+
+class LogFollower:
+    """Incremental analysis of one log file; call poll() periodically."""
+
+    def __init__(self, path, from_start=False, state_path=None, failed_threshold=5, window_minutes=5):
+        self.path = path
+        self.state_path = state_path
+        # Sniffed from the head of the file, not from wherever following starts;
+        # an empty or missing file is sniffed from the first bytes read instead
+        formats = detect_file_formats(path) if os.path.isfile(path) and os.path.getsize(path) else None
+        self.stream = StreamParser(formats, name=path)
+        self.detector = Detector(self.stream.events, failed_threshold, window_minutes)
+        self.events = 0
+        self.failed = 0
+        self.success = 0
+        self.findings = 0
+        self.rotations = 0
+        self._file = None
+        self._inode = None
+        # (detector.now, monotonic time when it last advanced). Log time only
+        # moves on by elapsed time: timestamps may trail the wall clock (a
+        # replayed backlog, a delayed writer, journald in UTC vs local time)
+        self._clock = (None, None)
+
+        state = self._load_state()
+        try:
+            inode, size = self._stat()
+        except FileNotFoundError:
+            return  # opened by poll() once it exists
+        if state and state.get('inode') == inode and state.get('offset', 0) <= size:
+            self._open(state['offset'])
+        else:
+            self._open(0 if from_start else size)
+
+    def _stat(self):
+        st = os.stat(self.path)
+        return st.st_ino, st.st_size
+
+    def _open(self, offset):
+        f = open(self.path, 'rb')
+        f.seek(offset)
+        self._file = f
+        self._inode = os.fstat(f.fileno()).st_ino
+        self.stream.rewind(offset)
+
+    def _load_state(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return None
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable follow state {self.state_path}: {e}")
+            return None
+        return state if state.get('path') == self.path else None
+
+    def _save_state(self):
+        if not self.state_path or self._file is None:
+            return
+        tmp = self.state_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'path': self.path, 'inode': self._inode, 'offset': self.stream.position}, f)
+        os.replace(tmp, self.state_path)
+
+    def _detect(self):
+        """Feed rows parsed since the last call to the detector, then drop them."""
+        table = self.stream.events
+        found = []
+        for i in range(len(table)):
+            if table.kind[i] & FAILED:
+                self.failed += 1
+            elif table.kind[i] & SUCCESS:
+                self.success += 1
+            found.extend(self.detector.add(i))
+        self.events += len(table)
+        # The detector keys users by name, so the interned names can go too
+        table.clear(users=True)
+        return found
+
+    def _read_to_end(self):
+        found = []
+        while True:
+            chunk = self._file.read(READ_SIZE)
+            if not chunk:
+                return found
+            self.stream.feed(chunk)
+            found.extend(self._detect())
+            found.extend(self.detector.poll())
+
+    def poll(self):
+        """Read everything appended since the last poll; returns the new findings."""
+        found = []
+        if self._file is None:
+            if not os.path.exists(self.path):
+                return found
+            self._open(0)
+        found.extend(self._read_to_end())
+
+        try:
+            inode, size = self._stat()
+        except FileNotFoundError:
+            inode, size = None, 0
+        if inode != self._inode:
+            # Rotated: the old file is drained above; its last line may lack a newline
+            self.stream.flush()
+            found.extend(self._detect())
+            self._file.close()
+            self._file = None
+            self.rotations += 1
+            if inode is not None:
+                self._open(0)
+                found.extend(self._read_to_end())
+        elif size < self._file.tell():
+            # Truncated in place; whatever partial line was pending is gone
+            self._file.seek(0)
+            self.stream.rewind(0)
+            found.extend(self._read_to_end())
+
+        # Caught up: let elapsed time close bursts on a quiet log
+        found.extend(self.detector.poll(self._log_clock()))
+        self.findings += len(found)
+        self._save_state()
+        return found
+
+    def _log_clock(self):
+        """Newest event time plus the wall time elapsed since it arrived."""
+        wall = time.monotonic()
+        if self.detector.now is None:
+            return None
+        if self.detector.now != self._clock[0]:
+            self._clock = (self.detector.now, wall)
+        return self._clock[0] + (wall - self._clock[1])
+
+    def status(self):
+        return {
+            'path': self.path,
+            'offset': self.stream.position,
+            'events': self.events,
+            'failed': self.failed,
+            'success': self.success,
+            'findings': self.findings,
+            'rotations': self.rotations,
+        }
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Follow an auth log and print findings as they appear.')
+    ap.add_argument('path', nargs='?', default='/var/log/auth.log')
+    ap.add_argument('--from-start', action='store_true', help='analyze the existing contents first (default: only new lines)')
+    ap.add_argument('--state', help='file to save the offset in, so a restart resumes where it stopped')
+    ap.add_argument('--interval', type=float, default=1.0, help='seconds between polls')
+    ap.add_argument('--threshold', type=int, default=5, help='failed logins per window for a burst')
+    ap.add_argument('--window', type=int, default=5, help='window in minutes')
+    ap.add_argument('--json', action='store_true', help='print one JSON object per finding')
+    args = ap.parse_args()
+
+    follower = LogFollower(args.path, args.from_start, args.state, args.threshold, args.window)
+    try:
+        while True:
+            for finding in follower.poll():
+                print(json.dumps(finding, default=str) if args.json else finding['description'], flush=True)
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        follower.close()
+
+
+if __name__ == '__main__':
+    main()
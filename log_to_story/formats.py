@@ -0,0 +1,337 @@
+"""Log format registry.
+
+Each LogFormat declares:
+
+- sniff(sample, name): a cheap test run once on the first SNIFF_BYTES of
+  a log (and its file name); true if the log holds this format.
+- prefilter: byte strings, one of which every event line of the format
+  contains. Lines with none of them are skipped before any decoding;
+  an empty prefilter means every line is decoded.
+- decode(line): the compiled line decoder. Returns (kind, ts, user, ip)
+  or None, where kind is FAILED, SUCCESS or LOCAL (activity on the
+  machine that is not a login, such as a sudo command), ts is a timestamp string for
+  parser.TimestampDecoder or int epoch seconds, and ip is a dotted quad
+  or None for local events (sudo, su) that have no source address.
+
+Syslog message formats (sshd, pam, sudo) can share one file, so every
+one that sniffs positive is used. Container formats (journald JSON,
+Windows EVTX JSON, web access logs, Python source) are exclusive.
+detect_formats() picks the names once per log; StreamParser runs only
+those decoders, so a format that is not in use costs nothing per line.
+"""
+import json
+import re
+
+from events import FAILED, LOCAL, SUCCESS
+
+# Bytes of the log looked at by detect_formats()
+SNIFF_BYTES = 64 * 1024
+# Used when no format recognizes the sample
+DEFAULT_FORMATS = ('sshd',)
+
+FORMATS = {}
+
+
+class LogFormat:
+    def __init__(self, name, decode, sniff, prefilter=(), exclusive=False):
+        self.name = name
+        self.decode = decode
+        self.sniff = sniff
+        self.prefilter = tuple(prefilter)
+        self.exclusive = exclusive
+
+
+def register_format(fmt):
+    """Add (or replace) a format; exclusive formats are sniffed in registration order."""
+    FORMATS[fmt.name] = fmt
+    return fmt
+
+
+def get_formats(names):
+    """Format names -> LogFormat objects; ValueError for an unknown name."""
+    try:
+        return [FORMATS[name] for name in names]
+    except KeyError as e:
+        raise ValueError(f"Unknown log format {e.args[0]!r}; known: {', '.join(FORMATS)}") from None
+
+
+def detect_formats(sample, name=None):
+    """Names of the formats to decode a log with, from its first bytes (str or bytes)."""
+    if isinstance(sample, (bytes, bytearray)):
+        sample = bytes(sample[:SNIFF_BYTES]).decode('utf-8', errors='ignore')
+    else:
+        sample = sample[:SNIFF_BYTES]
+    name = name or ''
+    for fmt in FORMATS.values():
+        if fmt.exclusive and fmt.sniff(sample, name):
+            return (fmt.name,)
+    found = tuple(fmt.name for fmt in FORMATS.values() if not fmt.exclusive and fmt.sniff(sample, name))
+    return found or DEFAULT_FORMATS
+
+
+def detect_file_formats(path, name=None):
+    """detect_formats() on the head of a file; `name` defaults to the path."""
+    with open(path, 'rb') as f:
+        return detect_formats(f.read(SNIFF_BYTES), name or path)
+
+
+def _first_line(sample):
+    for line in sample.splitlines():
+        if line.strip():
+            return line.lstrip()
+    return ''
+
+
+# -- syslog ---------------------------------------------------------------
+
+# Classic syslog "Mon DD HH:MM:SS" or RFC3339/ISO as written by rsyslog
+# (high-precision template) and journald's short-iso output.
+SYSLOG_TS_RE = re.compile(
+    r"\w{3}\s+\d{1,2}\s+\d{2}:\d{2}:\d{2}"
+    r"|\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?:Z|[+-]\d{2}:?\d{2})?")
+
+
+def _syslog(match):
+    """Line decoder for a syslog message matcher: adds the line's timestamp.
+
+    The timestamp is matched at the start of the line, or searched for in
+    the prefix before the message (e.g. behind a container log prefix).
+    """
+    def decode(line):
+        hit = match(line)
+        if hit is None:
+            return None
+        start, kind, user, ip = hit
+        ts_m = SYSLOG_TS_RE.match(line) or SYSLOG_TS_RE.search(line, 0, start)
+        if not ts_m:
+            return None
+        return kind, ts_m.group(), user, ip
+    return decode
+
+
+# Every sshd auth event carries " from <ip>", so a substring check rejects
+# most syslog noise before any regex runs. Surviving lines go through one
+# alternation that starts on a literal keyword and classifies failed vs
+# success in a single pass.
+EVENT_PREFILTER = ' from '
+EVENT_PREFILTER_BYTES = EVENT_PREFILTER.encode('ascii')
+AUTH_EVENT_RE = re.compile(
+    r"(?:(?P<failed>Failed password|Authentication failure|authentication failure) for(?: invalid user)?"
+    r"|(?P<success>Accepted password|session opened for user|Accepted publickey) for)"
+    r" (?P<user>\S+) from (?P<ip>\d+\.\d+\.\d+\.\d+)")
+
+
+def match_sshd(text):
+    m = AUTH_EVENT_RE.search(text)
+    if not m:
+        return None
+    return m.start(), FAILED if m.group('failed') else SUCCESS, m.group('user'), m.group('ip')
+
+
+def decode_sshd(line):
+    # _syslog(match_sshd) inlined: this is the hot path for ordinary auth.logs
+    m = AUTH_EVENT_RE.search(line)
+    if not m:
+        return None
+    ts_m = SYSLOG_TS_RE.match(line) or SYSLOG_TS_RE.search(line, 0, m.start())
+    if not ts_m:
+        return None
+    return FAILED if m.group('failed') else SUCCESS, ts_m.group(), m.group('user'), m.group('ip')
+
+
+# pam_unix lines of services other than sshd and sudo, whose own lines are
+# already decoded (counting both would double every attempt) and cron,
+# which opens a session every minute.
+PAM_SKIP_SERVICES = frozenset(('sshd', 'sudo', 'cron', 'CRON', 'systemd-user'))
+PAM_RE = re.compile(
+    r"pam_unix\((?P<service>[\w.-]+):auth\): authentication failure;.*?"
+    r" rhost=(?P<rhost>\S*)(?:\s+user=(?P<user>\S+))?"
+    r"|pam_unix\((?P<session_service>[\w.-]+):session\): session opened for user (?P<session_user>[^\s(]+)")
+_IPV4_RE = re.compile(r"\d+\.\d+\.\d+\.\d+$")
+
+
+def match_pam(text):
+    m = PAM_RE.search(text)
+    if not m:
+        return None
+    if m.group('service'):
+        if m.group('service') in PAM_SKIP_SERVICES:
+            return None
+        rhost = m.group('rhost')
+        return m.start(), FAILED, m.group('user') or 'unknown', rhost if _IPV4_RE.match(rhost) else None
+    if m.group('session_service') in PAM_SKIP_SERVICES:
+        return None
+    return m.start(), LOCAL, m.group('session_user'), None
+
+
+def _sniff_pam(sample, name):
+    return any((m.group('service') or m.group('session_service')) not in PAM_SKIP_SERVICES
+               for m in PAM_RE.finditer(sample))
+
+
+# "sudo: alice : TTY=pts/0 ; PWD=/home/alice ; USER=root ; COMMAND=/bin/ls"
+# runs a command; "3 incorrect password attempts" or "user NOT in sudoers"
+# before the TTY field is a failure.
+SUDO_RE = re.compile(
+    r"\bsudo(?:\[\d+\])?:\s+(?P<user>\S+) : "
+    r"(?:(?P<failed>\d+ incorrect password attempts?|user NOT in sudoers|command not allowed) ; )?"
+    r"(?:TTY|PWD)=")
+
+
+def match_sudo(text):
+    m = SUDO_RE.search(text)
+    if not m:
+        return None
+    return m.start(), FAILED if m.group('failed') else LOCAL, m.group('user'), None
+
+
+register_format(LogFormat(
+    'sshd', decode_sshd, lambda sample, name: 'sshd' in sample or bool(AUTH_EVENT_RE.search(sample)),
+    prefilter=(EVENT_PREFILTER_BYTES,)))
+register_format(LogFormat('pam', _syslog(match_pam), _sniff_pam, prefilter=(b'pam_unix(',)))
+register_format(LogFormat('sudo', _syslog(match_sudo), lambda sample, name: bool(SUDO_RE.search(sample)),
+                          prefilter=(b'sudo',)))
+
+
+# -- Python source --------------------------------------------------------
+
+# Python source sometimes embeds sample log lines in strings and comments
+PY_LOG_KEYWORDS = ('sshd', 'password', 'authentication', 'Failed', 'Accepted', 'Invalid')
+_PY_SYSLOG_TS_RE = re.compile(r'\b(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\s+\d{1,2}\s+\d{2}:\d{2}:\d{2}')
+
+
+def extract_log_line(line):
+    """Strip Python syntax (quotes, comments, assignments) in front of an embedded SSH log line.
+
+    Lines with a syslog timestamp (Mon DD HH:MM:SS) and an SSH keyword are
+    cut from the timestamp onwards; anything else is returned unchanged.
+    """
+    match = _PY_SYSLOG_TS_RE.search(line)
+    if match and any(kw in line for kw in PY_LOG_KEYWORDS):
+        return line[match.start():]
+    return line
+
+
+def decode_python(line):
+    return decode_sshd(extract_log_line(line))
+
+
+register_format(LogFormat('python', decode_python, lambda sample, name: name.endswith('.py'),
+                          prefilter=(EVENT_PREFILTER_BYTES,), exclusive=True))
+
+
+# -- journald JSON (journalctl -o json) -----------------------------------
+
+def decode_journald(line):
+    """One journal entry; the message is matched as sshd, pam or sudo syslog text.
+
+    __REALTIME_TIMESTAMP is UTC, unlike the local wall-clock time of syslog.
+    """
+    try:
+        entry = json.loads(line)
+        ts = int(entry['__REALTIME_TIMESTAMP']) // 1000000
+    except (ValueError, KeyError, TypeError):
+        return None
+    message = entry.get('MESSAGE')
+    if not isinstance(message, str):
+        return None
+    # journald keeps the program name apart; sudo's pattern needs it back
+    text = f"{entry.get('SYSLOG_IDENTIFIER', '')}: {message}"
+    for match in (match_sshd, match_pam, match_sudo):
+        hit = match(text)
+        if hit is not None:
+            _, kind, user, ip = hit
+            return kind, ts, user, ip
+    return None
+
+
+register_format(LogFormat(
+    'journald', decode_journald,
+    lambda sample, name: _first_line(sample).startswith('{') and '"__REALTIME_TIMESTAMP"' in sample,
+    prefilter=(EVENT_PREFILTER_BYTES, b'pam_unix(', b'sudo'), exclusive=True))
+
+
+# -- Windows Security log exported as JSON lines --------------------------
+
+# 4625 failed logon, 4771 Kerberos pre-authentication failed, 4624 logon
+EVTX_EVENTS = {4625: FAILED, 4771: FAILED, 4624: SUCCESS}
+# ConvertTo-Json writes dates as /Date(<ms since epoch>)/
+_JSON_DATE_RE = re.compile(r'/Date\((-?\d+)')
+
+
+def _evtx_value(value):
+    # evtx_dump writes elements with attributes as {"#attributes": ..., "#text": ...}
+    if isinstance(value, dict):
+        return value.get('#text', value.get('Value'))
+    return value
+
+
+def decode_evtx(line):
+    """One event as written by evtx_dump (-o jsonl) or a flat PowerShell/JSON export.
+
+    Successful logons only count when they came from an IPv4 address;
+    local service logons would otherwise drown everything else.
+    """
+    try:
+        entry = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(entry, dict):
+        return None
+    event = entry.get('Event', entry)
+    system = event.get('System', event)
+    data = event.get('EventData') or event
+    try:
+        kind = EVTX_EVENTS.get(int(_evtx_value(system.get('EventID', system.get('Id')))))
+    except (TypeError, ValueError):
+        return None
+    if kind is None:
+        return None
+
+    created = system.get('TimeCreated')
+    if isinstance(created, dict):
+        created = created.get('#attributes', created).get('SystemTime')
+    if not isinstance(created, str):
+        return None
+    m = _JSON_DATE_RE.match(created)
+    ts = int(m.group(1)) // 1000 if m else created
+
+    ip = data.get('IpAddress')
+    ip = ip if isinstance(ip, str) and _IPV4_RE.match(ip) else None
+    if kind == SUCCESS and ip is None:
+        return None
+    user = data.get('TargetUserName')
+    return kind, ts, user if isinstance(user, str) and user not in ('', '-') else 'unknown', ip
+
+
+register_format(LogFormat(
+    'evtx', decode_evtx,
+    lambda sample, name: _first_line(sample).startswith('{') and ('"EventID"' in sample or '"TargetUserName"' in sample),
+    prefilter=tuple(str(event_id).encode('ascii') for event_id in EVTX_EVENTS), exclusive=True))
+
+
+# -- web access logs (nginx / Apache common and combined) -----------------
+
+ACCESS_RE = re.compile(
+    r'(?P<ip>\d+\.\d+\.\d+\.\d+) \S+ (?P<user>\S+) \[(?P<ts>[^\]]+)\] "[^"]*" (?P<status>\d{3}) ')
+
+
+def decode_access(line):
+    """401/403 responses are failures; a 2xx/3xx with an authenticated user is a success."""
+    if ' - - [' in line and '" 40' not in line:
+        return None  # anonymous and not refused: nothing to report
+    m = ACCESS_RE.match(line)
+    if not m:
+        return None
+    status, user = m.group('status'), m.group('user')
+    if status in ('401', '403'):
+        kind = FAILED
+    elif user != '-' and status[0] in '23':
+        kind = SUCCESS
+    else:
+        return None
+    return kind, m.group('ts'), user if user != '-' else 'unknown', m.group('ip')
+
+
+register_format(LogFormat('access', decode_access, lambda sample, name: bool(ACCESS_RE.match(_first_line(sample))),
+                          exclusive=True))
@@ -4,6 +4,7 @@ import Head from 'next/head'
 import { PieChart, Pie, Cell, Legend, Tooltip, ResponsiveContainer } from 'recharts'
 
 const API_URL = process.env.NEXT_PUBLIC_API_URL || 'http://127.0.0.1:8000'
+const EVENTS_PER_PAGE = 20
 
 export default function Home() {
   const [logFile, setLogFile] = useState(null)
@@ -14,17 +15,30 @@ export default function Home() {
   const [result, setResult] = useState(null)
   const [error, setError] = useState(null)
   const [history, setHistory] = useState([])
+  const [historyTotal, setHistoryTotal] = useState(0)
   const [showHistory, setShowHistory] = useState(false)
   const [searchFilter, setSearchFilter] = useState('')
   const [statusFilter, setStatusFilter] = useState('all')
   const [dragActive, setDragActive] = useState(false)
   const [analysisStage, setAnalysisStage] = useState('')
+  const [eventsPage, setEventsPage] = useState({ events: [], total: 0, offset: 0 })
+  const [expandedEvent, setExpandedEvent] = useState(null)
 
   // Fetch history on mount
   useEffect(() => {
     fetchHistory()
   }, [])
 
+  // The result only carries the first events; the table pages through the rest on the server
+  useEffect(() => {
+    setExpandedEvent(null)
+    if (!result?.id) {
+      setEventsPage({ events: [], total: 0, offset: 0 })
+      return
+    }
+    fetchEvents(0)
+  }, [result, statusFilter])
+
   // Mouse trail effect
   useEffect(() => {
     const canvas = canvasRef.current
@@ -118,13 +132,45 @@ export default function Home() {
 
   const fetchHistory = async () => {
     try {
-      const response = await axios.get(`${API_URL}/history`)
+      // Only the list metadata and a narrative preview; the full result loads on demand
+      const response = await axios.get(`${API_URL}/history`, {
+        params: { limit: 5, fields: 'id,file_path,created_at,preview' }
+      })
       setHistory(response.data.analyses || [])
+      setHistoryTotal(response.data.total || 0)
     } catch (err) {
       console.error('Failed to fetch history:', err)
     }
   }
 
+  const fetchEvents = async (offset) => {
+    try {
+      const params = { offset, limit: EVENTS_PER_PAGE }
+      if (statusFilter !== 'all') params.status = statusFilter
+      const response = await axios.get(`${API_URL}/analysis/${result.id}/events`, { params })
+      setEventsPage(response.data)
+    } catch (err) {
+      console.error('Failed to fetch events:', err)
+    }
+  }
+
+  // Raw lines are not sent with the table; fetch one when its row is opened
+  const toggleRawLine = async (event) => {
+    if (expandedEvent?.index === event.index) {
+      setExpandedEvent(null)
+      return
+    }
+    setExpandedEvent({ index: event.index, raw: 'Loading...' })
+    try {
+      const response = await axios.get(`${API_URL}/analysis/${result.id}/events`, {
+        params: { offset: event.index, limit: 1, raw: 1 }
+      })
+      setExpandedEvent({ index: event.index, raw: response.data.events[0]?.raw ?? '' })
+    } catch (err) {
+      setExpandedEvent({ index: event.index, raw: 'Could not load the raw line' })
+    }
+  }
+
   const handleAnalyze = async () => {
     if (!logFile) {
       setError('Please upload a log file to analyze')
@@ -135,41 +181,67 @@ export default function Home() {
     setError(null)
     setResult(null)
 
-    // Simulate analysis stages
-    const stages = [
-      'Uploading file...',
-      'Parsing log entries...',
-      'Detecting threats...',
-      'Generating narrative...',
-      'Fetching recommendations...'
-    ]
-    
-    let stageIndex = 0
-    const stageInterval = setInterval(() => {
-      if (stageIndex < stages.length) {
-        setAnalysisStage(stages[stageIndex])
-        stageIndex++
-      }
-    }, 1500)
-
     const formData = new FormData()
     formData.append('logfile', logFile)
     if (playbookFile) {
       formData.append('playbook', playbookFile)
     }
 
+    setAnalysisStage('Uploading file...')
     try {
-      const response = await axios.post(`${API_URL}/analyze`, formData, {
-        headers: { 'Content-Type': 'multipart/form-data' },
-        timeout: 120000
-      })
-      console.log('Backend response:', response.data)
-      setResult(response.data)
+      // Server-Sent Events over a POST body: progress, findings, then the result
+      const response = await fetch(`${API_URL}/analyze/stream`, { method: 'POST', body: formData })
+      if (!response.ok || !response.body) {
+        throw new Error(`Analysis failed (${response.status})`)
+      }
+      const reader = response.body.getReader()
+      const decoder = new TextDecoder()
+      let buffer = ''
+      let threatsSoFar = 0
+      let final = null
+
+      const handleMessage = (event, data) => {
+        if (event === 'progress') {
+          const pct = data.bytes_total ? Math.round(100 * data.bytes_parsed / data.bytes_total) : 0
+          setAnalysisStage(`Parsing log entries... ${pct}% · ${data.failed} failed / ${data.success} successful · ${threatsSoFar} threat(s)`)
+        } else if (event === 'finding') {
+          threatsSoFar++
+        } else if (event === 'stage') {
+          setAnalysisStage('Generating narrative and recommendations...')
+        } else if (event === 'result') {
+          final = data
+        } else if (event === 'error') {
+          throw new Error(data.error)
+        }
+      }
+
+      while (true) {
+        const { value, done } = await reader.read()
+        if (done) break
+        buffer += decoder.decode(value, { stream: true })
+        let sep
+        while ((sep = buffer.indexOf('\n\n')) !== -1) {
+          const message = buffer.slice(0, sep)
+          buffer = buffer.slice(sep + 2)
+          let event = 'message'
+          let data = ''
+          for (const line of message.split('\n')) {
+            if (line.startsWith('event: ')) event = line.slice(7)
+            else if (line.startsWith('data: ')) data += line.slice(6)
+          }
+          handleMessage(event, data ? JSON.parse(data) : null)
+        }
+      }
+
+      if (!final) {
+        throw new Error('Analysis stream ended without a result')
+      }
+      console.log('Backend response:', final)
+      setResult(final)
       fetchHistory() // Refresh history after new analysis
     } catch (err) {
-      setError(err.response?.data?.detail || err.message || 'Analysis failed')
+      setError(err.message || 'Analysis failed')
     } finally {
-      clearInterval(stageInterval)
       setAnalysisStage('')
       setLoading(false)
     }
@@ -235,10 +307,9 @@ Feb  6 10:16:05 server sshd[12350]: Failed password for root from 10.0.0.50 port
 
   // Calculate threat severity
   const getThreatSeverity = () => {
-    if (!result?.findings) return null
-    const findings = result.findings
-    const failedEvents = findings.filter(f => f.status === 'Failed').length
-    const uniqueIPs = [...new Set(findings.filter(f => f.status === 'Failed').map(f => f.ip))].length
+    if (!result?.summary) return null
+    const failedEvents = result.summary.failed_attempts
+    const uniqueIPs = result.summary.unique_ips
     
     if (failedEvents > 50 || uniqueIPs > 10) return { level: 'CRITICAL', color: '#ef4444', bg: 'rgba(239, 68, 68, 0.15)' }
     if (failedEvents > 20 || uniqueIPs > 5) return { level: 'HIGH', color: '#f97316', bg: 'rgba(249, 115, 22, 0.15)' }
@@ -247,28 +318,23 @@ Feb  6 10:16:05 server sshd[12350]: Failed password for root from 10.0.0.50 port
   }
 
   const getStats = () => {
-    if (!result?.findings) return null
-    const findings = result.findings
-    const totalEvents = findings.length
-    const failedEvents = findings.filter(f => f.status === 'Failed').length
-    const successEvents = findings.filter(f => f.status === 'Accepted').length
-    const uniqueIPs = [...new Set(findings.map(f => f.ip))].length
-    console.log('Stats calculated:', { totalEvents, failedEvents, successEvents, uniqueIPs })
-    return { totalEvents, failedEvents, successEvents, uniqueIPs }
+    if (!result?.summary) return null
+    const summary = result.summary
+    return {
+      totalEvents: summary.total_events,
+      failedEvents: summary.failed_attempts,
+      successEvents: summary.successful_logins,
+      uniqueIPs: summary.unique_ips
+    }
   }
 
-  // Filter findings
+  // Status is filtered on the server; the search box narrows the page shown
   const getFilteredFindings = () => {
-    if (!result?.findings) return []
-    return result.findings.filter(f => {
-      const matchesSearch = searchFilter === '' || 
+    return eventsPage.events.filter(f => {
+      return searchFilter === '' ||
         (f.user && f.user.toLowerCase().includes(searchFilter.toLowerCase())) ||
         (f.ip && f.ip.includes(searchFilter)) ||
         (f.timestamp && f.timestamp.includes(searchFilter))
-      const matchesStatus = statusFilter === 'all' || 
-        (statusFilter === 'failed' && f.status === 'Failed') ||
-        (statusFilter === 'success' && f.status === 'Accepted')
-      return matchesSearch && matchesStatus
     })
   }
 
@@ -322,7 +388,7 @@ Feb  6 10:16:05 server sshd[12350]: Failed password for root from 10.0.0.50 port
                 className={`action-btn history-btn ${showHistory ? 'active' : ''}`} 
                 onClick={() => setShowHistory(!showHistory)}
               >
-                <span>📜</span> History ({history.length})
+                <span>📜</span> History ({historyTotal})
               </button>
             </div>
           </div>
@@ -341,7 +407,7 @@ Feb  6 10:16:05 server sshd[12350]: Failed password for root from 10.0.0.50 port
                         <span className="history-file">{item.file_path?.split(/[/\\]/).pop() || 'Unknown file'}</span>
                         <span className="history-date">{new Date(item.created_at).toLocaleString()}</span>
                       </div>
-                      <div className="history-preview">{item.narrative?.slice(0, 100)}...</div>
+                      <div className="history-preview">{item.preview}...</div>
                     </div>
                   ))}
                 </div>
@@ -370,12 +436,12 @@ Feb  6 10:16:05 server sshd[12350]: Failed password for root from 10.0.0.50 port
             <label className={`upload-card ${logFile ? 'has-file' : ''} ${dragActive ? 'drag-active' : ''}`}>
               <input
                 type="file"
-                accept=".log,.txt,.py"
+                accept=".log,.txt,.py,.json,.gz,.bz2,.xz,.zst,.tar,.tgz"
                 onChange={(e) => setLogFile(e.target.files[0])}
               />
               <div className="upload-icon">📋</div>
               <div className="upload-label">Security Log File</div>
-              <div className="upload-hint">Drag & drop or click to upload (.log, .txt, .py)</div>
+              <div className="upload-hint">Drag & drop or click to upload (.log, .txt, .py, .json; gzip/bz2/xz or .tar.gz archives)</div>
               {logFile && <div className="file-name">✓ {logFile.name}</div>}
             </label>
 
@@ -547,7 +613,7 @@ Feb  6 10:16:05 server sshd[12350]: Failed password for root from 10.0.0.50 port
             )}
 
             {/* Findings Table */}
-            {result.findings && result.findings.length > 0 && (
+            {result.events_total > 0 && (
               <div className="result-card">
                 <div className="result-header">
                   <div className="result-icon findings">🔎</div>
@@ -605,8 +671,8 @@ Feb  6 10:16:05 server sshd[12350]: Failed password for root from 10.0.0.50 port
                       </tr>
                     </thead>
                     <tbody>
-                      {filteredFindings.slice(0, 20).map((finding, idx) => (
-                        <tr key={idx}>
+                      {filteredFindings.map((finding) => [
+                        <tr key={finding.index} onClick={() => toggleRawLine(finding)} style={{ cursor: 'pointer' }}>
                           <td>{finding.timestamp || 'N/A'}</td>
                           <td>{finding.user || 'unknown'}</td>
                           <td>{finding.ip || 'N/A'}</td>
@@ -615,14 +681,37 @@ Feb  6 10:16:05 server sshd[12350]: Failed password for root from 10.0.0.50 port
                               {finding.status === 'Failed' ? '✗' : '✓'} {finding.status}
                             </span>
                           </td>
-                        </tr>
-                      ))}
+                        </tr>,
+                        expandedEvent?.index === finding.index && (
+                          <tr key={`${finding.index}-raw`}>
+                            <td colSpan={4} style={{ fontFamily: 'monospace', fontSize: '0.8rem', color: 'var(--text-secondary)', wordBreak: 'break-all' }}>
+                              {expandedEvent.raw}
+                            </td>
+                          </tr>
+                        )
+                      ])}
                     </tbody>
                   </table>
-                  {filteredFindings.length > 20 && (
-                    <p style={{ textAlign: 'center', color: 'var(--text-muted)', marginTop: '1rem' }}>
-                      Showing 20 of {filteredFindings.length} filtered events
-                    </p>
+                  {eventsPage.total > EVENTS_PER_PAGE && (
+                    <div style={{ display: 'flex', justifyContent: 'center', alignItems: 'center', gap: '1rem', marginTop: '1rem', color: 'var(--text-muted)' }}>
+                      <button
+                        className="filter-btn"
+                        disabled={eventsPage.offset === 0}
+                        onClick={() => fetchEvents(Math.max(0, eventsPage.offset - EVENTS_PER_PAGE))}
+                      >
+                        ‹ Prev
+                      </button>
+                      <span>
+                        Events {eventsPage.offset + 1}–{Math.min(eventsPage.offset + EVENTS_PER_PAGE, eventsPage.total)} of {eventsPage.total}
+                      </span>
+                      <button
+                        className="filter-btn"
+                        disabled={eventsPage.offset + EVENTS_PER_PAGE >= eventsPage.total}
+                        onClick={() => fetchEvents(eventsPage.offset + EVENTS_PER_PAGE)}
+                      >
+                        Next ›
+                      </button>
+                    </div>
                   )}
                   {filteredFindings.length === 0 && (
                     <p style={{ textAlign: 'center', color: 'var(--text-muted)', padding: '2rem' }}>
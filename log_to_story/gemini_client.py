@@ -1,33 +1,108 @@
 import os
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
 import httpx
 
 # Get API key from environment. You can set GEMINI_API_KEY in .env or environment.
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY', '')
 GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-2.0-flash')
+# Override to point the client at a local stub server in tests
+GEMINI_API_BASE = os.getenv('GEMINI_API_BASE', 'https://generativelanguage.googleapis.com')
 
-def generate_narrative(prompt: str) -> str:
-    """Call Google Gemini API to generate an enhanced incident narrative.
-    
-    If API key is missing or call fails, returns the original prompt as a fallback.
-    """
-    if not prompt:
-        return ''
-    if not GEMINI_API_KEY:
-        # Return a basic formatted narrative when no API key is available
-        return _fallback_narrative(prompt)
+# Max in-flight Gemini calls per worker
+GEMINI_MAX_CONCURRENCY = int(os.getenv('GEMINI_MAX_CONCURRENCY', '4'))
+# Wall-clock budget per narrative (queueing, retries and backoff included)
+GEMINI_BUDGET_SECONDS = float(os.getenv('GEMINI_BUDGET_SECONDS', '15'))
+GEMINI_RETRIES = int(os.getenv('GEMINI_RETRIES', '2'))
+GEMINI_CACHE_SIZE = int(os.getenv('GEMINI_CACHE_SIZE', '256'))
+GEMINI_CACHE_TTL = float(os.getenv('GEMINI_CACHE_TTL', '3600'))
 
-    # Google Generative AI REST API endpoint
-    url = f'https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:generateContent?key={GEMINI_API_KEY}'
-    
-    system_prompt = """You are a cybersecurity incident response analyst. 
+SYSTEM_PROMPT = """You are a cybersecurity incident response analyst. 
 Based on the following security log findings, generate a clear, concise narrative 
 that explains what happened, identifies potential threats, and summarizes the security incident. 
 Write in a professional but easy-to-understand style. Keep the narrative to 2-3 paragraphs."""
 
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+_client = None
+_semaphore = None
+_cache = OrderedDict()   # key -> (expires_at, narrative)
+_inflight = {}           # key -> asyncio.Future shared by identical concurrent calls
+
+
+def is_configured() -> bool:
+    """True when an API key is set, i.e. a Gemini call can change the narrative."""
+    return bool(GEMINI_API_KEY)
+
+
+def _get_client():
+    """Shared keep-alive connection pool, created on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            base_url=GEMINI_API_BASE,
+            limits=httpx.Limits(max_connections=GEMINI_MAX_CONCURRENCY,
+                                max_keepalive_connections=GEMINI_MAX_CONCURRENCY),
+            timeout=httpx.Timeout(GEMINI_BUDGET_SECONDS, connect=5.0),
+        )
+    return _client
+
+
+def _get_semaphore():
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+    return _semaphore
+
+
+async def aclose():
+    """Close the shared connection pool (app shutdown)."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def cache_key(prompt: str) -> str:
+    """Normalize findings text into a cache key: whitespace collapsed, line order ignored.
+
+    Timestamps stay in the key: the narrative quotes them, so incidents that
+    differ only in time must not share one.
+    """
+    lines = {' '.join(line.split()) for line in prompt.splitlines()}
+    lines.discard('')
+    text = '\n'.join(sorted(lines))
+    return hashlib.sha256(f"{GEMINI_MODEL}\n{text}".encode('utf-8')).hexdigest()
+
+
+def _cache_get(key):
+    hit = _cache.get(key)
+    if hit is None:
+        return None
+    expires_at, narrative = hit
+    if expires_at < time.monotonic():
+        del _cache[key]
+        return None
+    _cache.move_to_end(key)
+    return narrative
+
+
+def _cache_put(key, narrative):
+    _cache[key] = (time.monotonic() + GEMINI_CACHE_TTL, narrative)
+    _cache.move_to_end(key)
+    while len(_cache) > GEMINI_CACHE_SIZE:
+        _cache.popitem(last=False)
+
+
+def _build_request(prompt: str):
+    """Return (path, payload, headers) for a Gemini generateContent call."""
+    path = f'/v1beta/models/{GEMINI_MODEL}:generateContent'
     payload = {
         'contents': [{
             'parts': [{
-                'text': f"{system_prompt}\n\nFindings:\n{prompt}"
+                'text': f"{SYSTEM_PROMPT}\n\nFindings:\n{prompt}"
             }]
         }],
         'generationConfig': {
@@ -35,24 +110,87 @@ Write in a professional but easy-to-understand style. Keep the narrative to 2-3
             'maxOutputTokens': 500,
         }
     }
-    
-    headers = {'Content-Type': 'application/json'}
-    
+    headers = {'Content-Type': 'application/json', 'x-goog-api-key': GEMINI_API_KEY}
+    return path, payload, headers
+
+
+def _extract_text(data: dict):
+    # Extract text from Gemini response
+    candidates = data.get('candidates', [])
+    if candidates and 'content' in candidates[0]:
+        parts = candidates[0]['content'].get('parts', [])
+        if parts:
+            return parts[0].get('text')
+    return None
+
+
+async def _call_gemini(prompt: str):
+    """One narrative request, retried with exponential backoff on 429/5xx and transport errors."""
+    path, payload, headers = _build_request(prompt)
+    client = _get_client()
+    async with _get_semaphore():
+        for attempt in range(GEMINI_RETRIES + 1):
+            try:
+                r = await client.post(path, json=payload, headers=headers)
+                if r.status_code in RETRY_STATUS and attempt < GEMINI_RETRIES:
+                    await asyncio.sleep(0.5 * 2 ** attempt)
+                    continue
+                r.raise_for_status()
+                return _extract_text(r.json())
+            except httpx.TransportError:
+                if attempt >= GEMINI_RETRIES:
+                    raise
+                await asyncio.sleep(0.5 * 2 ** attempt)
+    return None
+
+
+def _finish_inflight(key, fut):
+    _inflight.pop(key, None)
+    if not fut.cancelled():
+        fut.exception()  # mark retrieved even if every waiter gave up
+
+
+async def agenerate_narrative(prompt: str, budget: float | None = None) -> str:
+    """Generate an enhanced incident narrative with Google Gemini.
+
+    Calls share one pooled AsyncClient and are capped at
+    GEMINI_MAX_CONCURRENCY in flight. Answers are cached by the normalized
+    findings text, and identical concurrent calls share one request. If the
+    API key is missing, the call fails, or it does not finish within
+    `budget` seconds (default GEMINI_BUDGET_SECONDS), the fallback
+    narrative is returned instead.
+    """
+    if not prompt:
+        return ''
+    if not GEMINI_API_KEY:
+        # Return a basic formatted narrative when no API key is available
+        return _fallback_narrative(prompt)
+
+    key = cache_key(prompt)
+    cached = _cache_get(key)
+    if cached is not None:
+        return cached
+
+    shared = _inflight.get(key)
+    if shared is None:
+        shared = _inflight[key] = asyncio.ensure_future(_call_gemini(prompt))
+        shared.add_done_callback(lambda fut: _finish_inflight(key, fut))
+
     try:
-        r = httpx.post(url, json=payload, headers=headers, timeout=60.0)
-        r.raise_for_status()
-        data = r.json()
-        # Extract text from Gemini response
-        candidates = data.get('candidates', [])
-        if candidates and 'content' in candidates[0]:
-            parts = candidates[0]['content'].get('parts', [])
-            if parts:
-                return parts[0].get('text', prompt)
+        # shield: one caller running out of budget must not cancel the shared call
+        text = await asyncio.wait_for(asyncio.shield(shared), budget or GEMINI_BUDGET_SECONDS)
+    except asyncio.TimeoutError:
+        print(f"Gemini API over budget ({budget or GEMINI_BUDGET_SECONDS}s); using fallback narrative")
         return _fallback_narrative(prompt)
     except Exception as e:
         print(f"Gemini API error: {e}")
         return _fallback_narrative(prompt)
 
+    if not text:
+        return _fallback_narrative(prompt)
+    _cache_put(key, text)
+    return text
+
 
 def _fallback_narrative(findings_text: str) -> str:
     """Generate a basic narrative when Gemini API is unavailable."""
@@ -0,0 +1,132 @@
+"""In-process background jobs for long analyses (POST /analyze?async=1).
+
+A JobQueue owns a bounded asyncio.Queue and a fixed set of worker tasks on
+the app's event loop. Workers only orchestrate: the blocking stages of an
+analysis still run in the threadpool / parse process pool, so JOB_WORKERS
+caps how many analyses are in flight, and JOB_QUEUE_SIZE caps how many
+uploads may wait on disk. When the queue is full, submit() raises
+QueueFull and the API answers 503 instead of piling up work.
+"""
+import asyncio
+import os
+import time
+import uuid
+from collections import OrderedDict
+
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+JOB_QUEUE_SIZE = int(os.getenv('JOB_QUEUE_SIZE', '16'))
+# Finished jobs kept for polling before the oldest are forgotten
+JOB_HISTORY = int(os.getenv('JOB_HISTORY', '256'))
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Job:
+    """Progress and outcome of one queued analysis.
+
+    Fields are plain attributes updated from worker threads; readers only
+    ever take a snapshot, so no locking is needed.
+    """
+
+    def __init__(self, args):
+        self.id = uuid.uuid4().hex
+        self.args = args
+        self.stage = 'queued'
+        self.bytes_total = 0
+        self.bytes_parsed = 0
+        self.events = 0
+        self.error = None
+        self.result = None
+        self.created = time.time()
+        self.finished = None
+
+    def update(self, **fields):
+        for name, value in fields.items():
+            setattr(self, name, value)
+
+    @property
+    def done(self):
+        return self.stage in ('done', 'failed')
+
+    def snapshot(self):
+        """Status dict for GET /jobs/{id}; includes the result once done."""
+        status = {
+            'id': self.id,
+            'stage': self.stage,
+            'bytes_total': self.bytes_total,
+            'bytes_parsed': self.bytes_parsed,
+            'events': self.events,
+            'created': self.created,
+            'finished': self.finished,
+        }
+        if self.error is not None:
+            status['error'] = self.error
+        if self.stage == 'done':
+            status['result'] = self.result
+        return status
+
+
+class JobQueue:
+    """Bounded queue of jobs run by `workers` tasks calling `await run(job, *job.args)`."""
+
+    def __init__(self, run, workers=JOB_WORKERS, maxsize=JOB_QUEUE_SIZE, history=JOB_HISTORY):
+        self.run = run
+        self.workers = workers
+        self.maxsize = maxsize
+        self.history = history
+        self.jobs = OrderedDict()
+        self._queue = None
+        self._tasks = []
+
+    async def start(self):
+        self._queue = asyncio.Queue(self.maxsize)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def full(self):
+        return self._queue is None or self._queue.full()
+
+    def submit(self, *args):
+        """Queue a job; raises QueueFull when the queue is at capacity."""
+        if self._queue is None:
+            raise QueueFull('job queue is not running')
+        job = Job(args)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFull(f'{self.maxsize} analyses already queued') from None
+        self.jobs[job.id] = job
+        self._trim()
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.done]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self.jobs[job_id]
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                job.result = await self.run(job, *job.args)
+                job.update(stage='done')
+            except asyncio.CancelledError:
+                job.update(stage='failed', error='server shutting down')
+                raise
+            except Exception as e:
+                print(f"Analysis job {job.id} failed: {e}")
+                job.update(stage='failed', error=str(e))
+            finally:
+                job.finished = time.time()
+                job.args = None
+                self._queue.task_done()
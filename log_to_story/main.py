@@ -1,25 +1,78 @@
 import os
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-from fastapi import FastAPI, UploadFile, File, Form
+from fastapi import FastAPI, UploadFile, File, Form, Query, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import HTMLResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from parser import parse_log, analyze_findings
-from rag_faiss import load_playbook_index, query_playbook
-from gemini_client import generate_narrative
-from db import init_db, save_analysis, get_all_analyses, get_analysis_by_id
-import shutil
-import ast
-import re
-
-# Load environment variables from .env file
+
+# Load environment variables from .env file (before the modules below read their config)
 APP_ROOT = os.path.dirname(os.path.abspath(__file__))
 load_dotenv(os.path.join(APP_ROOT, '.env'))
 
-UPLOAD_DIR = os.path.join(APP_ROOT, 'uploads')
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+from events import FAILED, LOCAL, SUCCESS, datetime_to_ts, format_ts, ipv4_range
+from detectors import Detector
+from parser import (StreamParser, analyze_findings, inspect_log, parse_path, shutdown_pool, PARSE_WORKERS,
+                    PARSER_VERSION)
+from formats import get_formats
+from compression import open_log
+from rag_faiss import load_playbook_index, query_playbook, warm_up
+from gemini_client import agenerate_narrative, is_configured as gemini_configured, aclose as close_gemini_client
+from jobs import JobQueue, QueueFull
+from follow import LogFollower
+from storage import store_upload, unpin, file_digest, result_key, get_result, put_result, enforce_retention
+from db import (init_db, close_db, asave_analysis, aget_analyses, aget_analysis_by_id, aget_events, aget_event_batch,
+                ahistory_version, asearch_events, HISTORY_FIELDS, DEFAULT_HISTORY_FIELDS, HISTORY_MAX_LIMIT, EVENTS_PAGE_SIZE)
+import asyncio
+import base64
+import hashlib
+import time
+import orjson
+from functools import lru_cache
+from datetime import datetime, timedelta
+
+DEFAULT_PLAYBOOK = os.path.join(APP_ROOT, 'playbook.md')
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Load the embedding model and default playbook index once per worker
+    await run_in_threadpool(warm_up, DEFAULT_PLAYBOOK)
+    await jobs.start()
+    yield
+    await jobs.stop()
+    shutdown_pool()
+    await close_gemini_client()
+    close_db()
+
+
+def encode_json(obj):
+    """JSON bytes for results, pages and messages.
+
+    orjson writes the datetimes from analyze_findings, tuples and numpy
+    scalars natively, so nothing goes through jsonable_encoder's
+    per-value reflection first. The output matches it: ISO datetimes,
+    UTF-8, no whitespace.
+    """
+    return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+class FastJSONResponse(Response):
+    """application/json response rendered with encode_json.
+
+    Stands in for fastapi's ORJSONResponse, which is deprecated in newer
+    releases and warns on every response.
+    """
+    media_type = 'application/json'
+
+    def render(self, content):
+        return encode_json(content)
 
-app = FastAPI(title="SherlockLogs API", description="AI-powered Security Log Analysis")
+
+app = FastAPI(title="SherlockLogs API", description="AI-powered Security Log Analysis", lifespan=lifespan,
+              default_response_class=FastJSONResponse)
 
 # Get allowed origins from environment for production deployments
 ALLOWED_ORIGINS = os.getenv('ALLOWED_ORIGINS', 
@@ -33,18 +86,38 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
+
+class StreamingExemptGZipMiddleware(GZipMiddleware):
+    """GZipMiddleware that never touches the streaming endpoints.
+
+    Older Starlette releases (still allowed by requirements.txt) compress
+    and buffer text/event-stream too, so SSE progress would arrive in one
+    lump at the end.
+    """
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and scope['path'].endswith('/stream'):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+# Compress large JSON bodies (history pages, full results); the SSE and
+# NDJSON streams go out uncompressed
+app.add_middleware(StreamingExemptGZipMiddleware, minimum_size=1024)
+
 init_db(os.path.join(APP_ROOT, 'data.db'))
 
 
-def build_narrative_story(parsed, formatted_events, pattern_findings):
-    """Build a comprehensive narrative story from the analysis."""
-    total_events = len(formatted_events)
-    failed_events = [e for e in formatted_events if e['status'] == 'Failed']
-    success_events = [e for e in formatted_events if e['status'] == 'Accepted']
-    unique_ips = list(set(e['ip'] for e in formatted_events if e['ip'] != 'N/A'))
-    unique_users = list(set(e['user'] for e in formatted_events if e['user'] != 'unknown'))
+def build_narrative_story(summary, pattern_findings):
+    """Build a comprehensive narrative story from the analysis summary (see events.summarize)."""
+    # Local sudo/PAM activity is not an authentication event
+    total_events = summary['total_events'] - summary['local_events']
+    failed_count = summary['failed_attempts']
+    success_count = summary['successful_logins']
     
     # Build narrative sections
     narrative_parts = []
@@ -55,16 +128,13 @@ def build_narrative_story(parsed, formatted_events, pattern_findings):
         narrative_parts.append("No authentication events were detected in the provided log file. This may indicate that the file format is incompatible or contains no SSH authentication entries.")
         return '\n\n'.join(narrative_parts)
     
-    threat_level = "CRITICAL" if len(failed_events) > 50 else "HIGH" if len(failed_events) > 20 else "MEDIUM" if len(failed_events) > 5 else "LOW"
-    narrative_parts.append(f"Threat Level: **{threat_level}** | Total Events: **{total_events}** | Failed Attempts: **{len(failed_events)}** | Successful Logins: **{len(success_events)}**")
+    threat_level = "CRITICAL" if failed_count > 50 else "HIGH" if failed_count > 20 else "MEDIUM" if failed_count > 5 else "LOW"
+    narrative_parts.append(f"Threat Level: **{threat_level}** | Total Events: **{total_events}** | Failed Attempts: **{failed_count}** | Successful Logins: **{success_count}**")
     
     # Timeline Analysis
     narrative_parts.append("\n**⏱️ TIMELINE ANALYSIS**")
-    if formatted_events:
-        first_event = formatted_events[0]
-        last_event = formatted_events[-1]
-        narrative_parts.append(f"Analysis period: {first_event['timestamp']} to {last_event['timestamp']}")
-        narrative_parts.append(f"Attack originated from **{len(unique_ips)}** unique IP address(es) targeting **{len(unique_users)}** user account(s).")
+    narrative_parts.append(f"Analysis period: {summary['first_ts']} to {summary['last_ts']}")
+    narrative_parts.append(f"Attack originated from **{summary['unique_ips']}** unique IP address(es) targeting **{summary['known_users']}** user account(s).")
     
     # Threat Analysis
     narrative_parts.append("\n**🔍 THREAT ANALYSIS**")
@@ -73,51 +143,41 @@ def build_narrative_story(parsed, formatted_events, pattern_findings):
         for i, finding in enumerate(pattern_findings, 1):
             narrative_parts.append(f"{i}. {finding.get('description', 'Unknown pattern')}")
     else:
-        if len(failed_events) > 0:
-            narrative_parts.append(f"The log shows **{len(failed_events)} failed authentication attempts** scattered across multiple IPs and users, suggesting reconnaissance or distributed attack activity.")
+        if failed_count > 0:
+            narrative_parts.append(f"The log shows **{failed_count} failed authentication attempts** scattered across multiple IPs and users, suggesting reconnaissance or distributed attack activity.")
         else:
             narrative_parts.append("No suspicious patterns detected. All authentication events appear to be legitimate.")
     
     # Attack Sources
-    if unique_ips:
+    if summary['unique_ips']:
         narrative_parts.append("\n**🌐 ATTACK SOURCES**")
-        ip_counts = {}
-        for event in failed_events:
-            ip = event['ip']
-            ip_counts[ip] = ip_counts.get(ip, 0) + 1
-        top_attackers = sorted(ip_counts.items(), key=lambda x: x[1], reverse=True)[:5]
         narrative_parts.append("Top attacking IP addresses:")
-        for ip, count in top_attackers:
+        for ip, count in summary['top_failed_ips']:
             narrative_parts.append(f"- **{ip}**: {count} failed attempt(s)")
     
     # Targeted Accounts
-    if unique_users:
+    if summary['known_users']:
         narrative_parts.append("\n**👤 TARGETED ACCOUNTS**")
-        user_counts = {}
-        for event in failed_events:
-            user = event['user']
-            user_counts[user] = user_counts.get(user, 0) + 1
-        top_targets = sorted(user_counts.items(), key=lambda x: x[1], reverse=True)[:5]
         narrative_parts.append("Most targeted user accounts:")
-        for user, count in top_targets:
+        for user, count in summary['top_failed_users']:
             narrative_parts.append(f"- **{user}**: {count} failed attempt(s)")
     
     # Successful Compromises
-    if success_events:
+    if success_count:
         narrative_parts.append("\n**⚠️ SUCCESSFUL AUTHENTICATIONS**")
-        narrative_parts.append(f"**{len(success_events)} successful login(s) detected:**")
-        for event in success_events[:5]:  # Show first 5
+        narrative_parts.append(f"**{success_count} successful login(s) detected:**")
+        for event in summary['sample_successes']:  # Show first 5
             narrative_parts.append(f"- User **{event['user']}** from **{event['ip']}** at {event['timestamp']}")
-        if len(success_events) > 5:
-            narrative_parts.append(f"... and {len(success_events) - 5} more")
+        if success_count > 5:
+            narrative_parts.append(f"... and {success_count - 5} more")
     
     # Recommendations
     narrative_parts.append("\n**✅ RECOMMENDED ACTIONS**")
-    if len(failed_events) > 20:
+    if failed_count > 20:
         narrative_parts.append("1. Implement rate limiting and IP blocking for repeated failed attempts")
         narrative_parts.append("2. Enable multi-factor authentication (MFA) for all accounts")
         narrative_parts.append("3. Review firewall rules to restrict SSH access to trusted networks")
-    if success_events and failed_events:
+    if success_count and failed_count:
         narrative_parts.append("4. Investigate successful logins that occurred after multiple failures")
         narrative_parts.append("5. Reset passwords for compromised accounts and enforce strong password policies")
     narrative_parts.append("6. Monitor logs continuously for similar attack patterns")
@@ -126,27 +186,18 @@ def build_narrative_story(parsed, formatted_events, pattern_findings):
     return '\n\n'.join(narrative_parts)
 
 
-def extract_logs_from_python(content):
-    """Extract SSH logs from a Python file.
-    
-    Finds lines with syslog format (Mon DD HH:MM:SS) and SSH keywords,
-    extracting them from Python syntax (quotes, comments, assignments).
-    """
-    log_lines = []
-    # Regex pattern for syslog timestamp
-    syslog_pattern = re.compile(r'\b(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\s+\d{1,2}\s+\d{2}:\d{2}:\d{2}')
-    
-    for line in content.splitlines():
-        # Check if line has both a timestamp and SSH keywords
-        if syslog_pattern.search(line) and any(kw in line for kw in ['sshd', 'password', 'authentication', 'Failed', 'Accepted', 'Invalid']):
-            # Extract from the timestamp onwards (skip Python syntax before it)
-            match = syslog_pattern.search(line)
-            if match:
-                log_part = line[match.start():]
-                log_lines.append(log_part)
-    
-    result = '\n'.join(log_lines)
-    return result if result.strip() else content
+# Upload read size for streaming ingestion
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Uploads at least this large are parsed across PARSE_WORKERS processes
+PARALLEL_PARSE_MIN_BYTES = int(os.getenv('PARALLEL_PARSE_MIN_BYTES', str(64 * 1024 * 1024)))
+# Seconds of parsing between progress messages on /analyze/stream
+STREAM_PROGRESS_INTERVAL = float(os.getenv('STREAM_PROGRESS_INTERVAL', '0.25'))
+# Logs /ws/follow may tail (comma-separated paths) and how often it polls them
+FOLLOW_PATHS = [p for p in os.getenv('FOLLOW_PATHS', '/var/log/auth.log').split(',') if p]
+FOLLOW_INTERVAL = float(os.getenv('FOLLOW_INTERVAL', '1.0'))
+# Directories POST /analyze/path may read from. Files there are mapped while
+# parsed, so do not point it at logs rotated with copytruncate mid-analysis.
+ANALYZE_PATH_DIRS = [os.path.realpath(p) for p in os.getenv('ANALYZE_PATH_DIRS', '/var/log').split(',') if p]
 
 
 @app.get('/', response_class=HTMLResponse)
@@ -160,100 +211,708 @@ def health_check():
     return {'status': 'healthy', 'service': 'SherlockLogs API'}
 
 
-@app.post('/analyze')
-async def analyze(logfile: UploadFile = File(...), playbook: UploadFile | None = None):
-    # save uploaded logfile
-    filepath = os.path.join(UPLOAD_DIR, logfile.filename)
-    with open(filepath, 'wb') as f:
-        shutil.copyfileobj(logfile.file, f)
+def parse_saved_log(filepath, formats, progress=None):
+    """Parse a stored log with the named formats and run the detectors.
 
-    text = open(filepath, 'r', encoding='utf-8', errors='ignore').read()
-    
-    # If it's a Python file, extract logs from it
-    if logfile.filename.endswith('.py'):
-        text = extract_logs_from_python(text)
-    
-    parsed = parse_log(text)
+    Blocking (disk I/O and CPU-bound parsing); run it in a worker thread.
+    Compressed logs are decompressed on the fly and the members of a tar
+    archive are parsed concurrently (see parser.parse_path). Plain logs of
+    PARALLEL_PARSE_MIN_BYTES or more are parsed across the process pool.
+    `progress` (a jobs.Job) is updated with bytes parsed (as stored, i.e.
+    compressed) and events found as parsing proceeds.
+    """
+    size = os.path.getsize(filepath)
+    report = None
+    if progress is not None:
+        progress.update(stage='parsing', bytes_total=size)
+
+        def report(bytes_read, events):
+            progress.update(bytes_parsed=bytes_read, events=events)
+
+    parsed = parse_path(filepath, formats, workers=PARSE_WORKERS, progress=report,
+                        parallel_min_bytes=PARALLEL_PARSE_MIN_BYTES)
+    if progress is not None:
+        progress.update(stage='detecting', bytes_parsed=size, events=len(parsed['events']))
     analyze_findings(parsed)
-    
+    return parsed
+
+
+@lru_cache(maxsize=64)
+def _playbook_digest(path, mtime_ns, size):
+    return file_digest(path)
+
+
+# Bumped whenever the shape of an /analyze result changes, so cached bodies
+# in the old shape are not served again
+RESULT_VERSION = 2
+
+
+def analysis_cache_key(log_digest, formats, playbook_path):
+    """Result-cache key: (log hash, playbook hash, parser/result version and the formats decoded)."""
+    playbook_path = playbook_path or DEFAULT_PLAYBOOK
+    st = os.stat(playbook_path)
+    # formats is None for an archive: each member is sniffed on its own
+    return result_key(log_digest, _playbook_digest(playbook_path, st.st_mtime_ns, st.st_size),
+                      f"{PARSER_VERSION}.{RESULT_VERSION}/{'+'.join(formats) if formats else 'members'}")
+
+
+def parse_format_param(value):
+    """'sshd,sudo' -> ('sshd', 'sudo'); None when not given. ValueError for unknown names."""
+    if not value:
+        return None
+    names = tuple(name.strip() for name in value.split(',') if name.strip())
+    get_formats(names)
+    return names or None
+
+
+def _describe_log(log_path, log_digest, filename, playbook_path, formats, identity=None):
+    # Sniffed once here (through any compression); everything downstream
+    # decodes with these formats
+    compression, detected = inspect_log(log_path, filename)
+    return {
+        'path': log_path,
+        'digest': log_digest,
+        'filename': filename,
+        'compression': compression,
+        'archive': detected is None,
+        'formats': formats or detected,
+        'playbook': playbook_path,
+        'key': analysis_cache_key(identity or log_digest, formats or detected, playbook_path),
+    }
+
+
+def release_upload(upload):
+    """Unpin the stored blobs of an upload once its analysis is over (see storage.pin)."""
+    for path in upload['pinned']:
+        unpin(path)
+
+
+def _described(pinned, describe, *args):
+    try:
+        upload = describe(*args)
+    except BaseException:
+        for path in pinned:
+            unpin(path)
+        raise
+    upload['pinned'] = pinned
+    return upload
+
+
+def _prepare_upload(fileobj, filename, playbook_file, formats):
+    log_digest, log_path = store_upload(fileobj, pinned=True)
+    pinned = [log_path]
+    playbook_path = None
+    try:
+        if playbook_file is not None:
+            playbook_path = store_upload(playbook_file, pinned=True)[1]
+            pinned.append(playbook_path)
+    except BaseException:
+        unpin(log_path)
+        raise
+    return _described(pinned, _describe_log, log_path, log_digest, filename, playbook_path, formats)
+
+
+def resolve_server_log(path):
+    """Real path of a server-side log; PermissionError outside ANALYZE_PATH_DIRS."""
+    real = os.path.realpath(path)
+    if not any(os.path.commonpath([real, root]) == root for root in ANALYZE_PATH_DIRS):
+        raise PermissionError(f"{path} is not inside ANALYZE_PATH_DIRS")
+    if not os.path.isfile(real):
+        raise FileNotFoundError(f"No such log file: {path}")
+    return real
+
+
+def _prepare_server_log(path, playbook_file, formats):
+    real = resolve_server_log(path)
+    playbook_path = store_upload(playbook_file, pinned=True)[1] if playbook_file is not None else None
+    # Hashing a 20 GB log would cost a full extra read; a file that has not
+    # changed keeps its inode, size and mtime
+    st = os.stat(real)
+    identity = hashlib.sha256(f'{real}\0{st.st_ino}\0{st.st_size}\0{st.st_mtime_ns}'.encode()).hexdigest()
+    return _described([playbook_path] if playbook_path else [], _describe_log,
+                      real, None, real, playbook_path, formats, identity)
+
+
+async def store_uploads(logfile, playbook, formats=None):
+    """Store the log (and playbook) by content hash and pick the log formats.
+
+    Returns the upload dict: path, digest, filename, compression (None
+    for plain text), archive (a tar of logs), formats (None for an archive
+    sniffed member by member), playbook (path or None), key (the
+    result-cache key) and pinned (blobs kept from retention until
+    release_upload()).
+
+    The log is written to the store in full before parsing starts, then
+    read back; hashing needs the whole upload first, and a cache hit then
+    skips the parse entirely.
+    """
+    return await run_in_threadpool(_prepare_upload, logfile.file, logfile.filename,
+                                   playbook.file if playbook else None, formats)
+
+
+def cache_result(key, result):
+    """Encode a finished result, store it under `key` and return the bytes."""
+    body = encode_json(result)
+    try:
+        put_result(key, body)
+        enforce_retention()
+    except OSError as e:
+        print(f"Could not cache analysis result: {e}")
+    return body
+
+
+def recommend(playbook_path, query):
+    """Look up playbook recommendations for `query` (blocking: embedding and file I/O)."""
+    # load or build playbook index
+    index = load_playbook_index(playbook_path or DEFAULT_PLAYBOOK)
+    return query_playbook(index, query, top_k=3)
+
+
+# Playbook queries per finding type. Recommendations are looked up from the
+# compact set of finding types rather than the narrative, so the handful of
+# possible combinations are memoized by query_playbook.
+FINDING_QUERIES = {
+    'brute_force': 'repeated failed logins brute force credential stuffing',
+    'post_failure_success': 'successful login after failed attempts, possibly compromised account',
+}
+NO_FINDINGS_QUERY = 'routine authentication activity monitoring'
+
+
+def recommendation_query(findings):
+    """Stable RAG query built from the set of finding types."""
+    types = sorted({f['type'] for f in findings})
+    return '\n'.join(FINDING_QUERIES.get(t, t.replace('_', ' ')) for t in types) or NO_FINDINGS_QUERY
+
+
+async def enhance_narrative(narrative, findings):
+    """Ask Gemini for a narrative only when it can change the result.
+
+    Without an API key, or with zero findings, the built narrative is final.
+    """
+    if not findings or not gemini_configured():
+        return narrative
+    ai_enhanced = await agenerate_narrative('\n'.join(f['description'] for f in findings))
+    # Use AI-enhanced narrative if available, otherwise use our detailed story
+    return ai_enhanced if ai_enhanced and len(ai_enhanced) > 100 else narrative
+
+
+def format_events(table, limit=EVENTS_PAGE_SIZE):
+    """First page of events for the table display, shaped like GET /analysis/{id}/events.
+
+    Raw lines are left out; the rest of the events and their lines are
+    fetched from that endpoint.
+    """
+    return [{
+        'index': i,
+        'timestamp': format_ts(table.ts[i]),
+        'user': table.user(i),
+        'ip': table.ip_str(i),
+        'status': table.status(i),
+    } for i in range(min(limit, len(table)))]
+
+
+async def complete_analysis(parsed, upload, progress=None):
+    """Narrative, recommendations and DB record for a parsed upload; returns the result dict."""
     # Get pattern-based findings (brute force, post-failure success)
     pattern_findings = parsed.get('findings', [])
-    
-    # Format events for frontend display (individual log events)
-    formatted_events = []
-    for event in parsed.get('events', []):
-        formatted_events.append({
-            'timestamp': event['ts'].strftime('%Y-%m-%d %H:%M:%S') if event.get('ts') else 'N/A',
-            'user': event.get('user', 'unknown'),
-            'ip': event.get('ip', 'N/A'),
-            'status': 'Failed' if event.get('type') == 'failed' else 'Accepted',
-            'raw': event.get('raw', '')
-        })
-    
-    # Build comprehensive narrative story
-    narrative = build_narrative_story(parsed, formatted_events, pattern_findings)
-    
-    # Optionally enhance with Gemini AI (if API key is available)
-    ai_enhanced = generate_narrative('\n'.join([f['description'] for f in pattern_findings]) if pattern_findings else "Security log analysis")
-    
-    # Use AI-enhanced narrative if available, otherwise use our detailed story
-    final_narrative = ai_enhanced if ai_enhanced and len(ai_enhanced) > 100 else narrative
+    summary = parsed['summary']
 
-    # load or build playbook index
-    if playbook:
-        pb_path = os.path.join(UPLOAD_DIR, playbook.filename)
-        with open(pb_path, 'wb') as f:
-            shutil.copyfileobj(playbook.file, f)
-        index = load_playbook_index(pb_path)
-    else:
-        default_pb = os.path.join(APP_ROOT, 'playbook.md')
-        index = load_playbook_index(default_pb)
+    # Build comprehensive narrative story
+    narrative = build_narrative_story(summary, pattern_findings)
+    if progress is not None:
+        progress.update(stage='enriching')
 
-    recs = query_playbook(index, final_narrative, top_k=3)
+    # The LLM call and the playbook lookup are independent; run them together
+    final_narrative, recs = await asyncio.gather(
+        enhance_narrative(narrative, pattern_findings),
+        run_in_threadpool(recommend, upload['playbook'], recommendation_query(pattern_findings)),
+    )
 
     # save to DB and return JSON
-    record_id = save_analysis(filepath, final_narrative, recs)
+    if progress is not None:
+        progress.update(stage='saving')
+    record_id = await asave_analysis(upload['filename'], final_narrative, recs, parsed['events'], pattern_findings,
+                                    summary, upload['digest'])
+    formatted_events = await run_in_threadpool(format_events, parsed['events'])
 
     return {
         'id': record_id, 
         'narrative': final_narrative, 
         'recs': recs, 
-        'findings': formatted_events,  # Individual events for table display
+        'findings': formatted_events,  # First page of events for table display
+        'events_total': len(parsed['events']),
         'threats': pattern_findings,    # Pattern-based detections
-        'summary': {
-            'total_events': len(formatted_events),
-            'failed_attempts': len([e for e in formatted_events if e['status'] == 'Failed']),
-            'successful_logins': len([e for e in formatted_events if e['status'] == 'Accepted']),
-            'unique_ips': len(set(e['ip'] for e in formatted_events)),
-            'unique_users': len(set(e['user'] for e in formatted_events)),
-        }
+        'summary': summary,
     }
 
 
-@app.get('/history')
-async def get_history():
-    """Get all past analyses."""
-    analyses = get_all_analyses()
-    # Parse the recs string back to list
-    for a in analyses:
+async def run_analysis_job(job, upload):
+    """Job body for /analyze?async=1: the log is already stored (see store_uploads)."""
+    try:
+        cached = await run_in_threadpool(get_result, upload['key'])
+        if cached is None:
+            parsed = await run_in_threadpool(parse_saved_log, upload['path'], upload['formats'], job)
+            result = await complete_analysis(parsed, upload, job)
+            cached = await run_in_threadpool(cache_result, upload['key'], result)
+    finally:
+        release_upload(upload)
+    # Decoded once here so polling /jobs/{id} does not redo it
+    return await run_in_threadpool(orjson.loads, cached)
+
+
+jobs = JobQueue(run_analysis_job)
+
+
+@app.post('/analyze')
+async def analyze(logfile: UploadFile = File(...), playbook: UploadFile | None = None,
+                  run_async: bool = Query(False, alias='async'),
+                  log_format: str | None = Query(None, alias='format')):
+    """Analyze an uploaded log.
+
+    The log format is detected from the first bytes of the upload unless
+    ?format= names it (comma-separated, see formats.FORMATS). Uploads
+    are stored by content hash; a log already analyzed with the same
+    playbook, parser version and formats is answered from the result
+    cache (X-Cache: hit). With ?async=1 the log is queued and a job id is
+    returned at once (202); poll GET /jobs/{id} for progress and the
+    result. A full queue answers 503.
+    """
+    try:
+        formats = parse_format_param(log_format)
+    except ValueError as e:
+        return FastJSONResponse({'error': str(e)}, status_code=400)
+    if run_async and jobs.full():
+        return FastJSONResponse({'error': 'Analysis queue is full, retry later'}, status_code=503,
+                            headers={'Retry-After': '30'})
+
+    # Every blocking stage runs in the threadpool (or the parse process pool)
+    # so the event loop stays free for other requests.
+    try:
+        upload = await store_uploads(logfile, playbook, formats)
+    except ValueError as e:  # corrupt or truncated compressed data, or zstd without zstandard
+        return FastJSONResponse({'error': str(e)}, status_code=400)
+    return await respond_with_analysis(upload, run_async)
+
+
+async def respond_with_analysis(upload, run_async=False):
+    """Cached result, queued job (202) or a fresh analysis of a prepared upload."""
+    if run_async:
+        try:
+            job = jobs.submit(upload)
+        except QueueFull:
+            release_upload(upload)
+            return FastJSONResponse({'error': 'Analysis queue is full, retry later'}, status_code=503,
+                                headers={'Retry-After': '30'})
+        return FastJSONResponse({'job_id': job.id, 'status_url': f'/jobs/{job.id}'}, status_code=202)
+
+    try:
+        cached = await run_in_threadpool(get_result, upload['key'])
+        if cached is not None:
+            return Response(cached, media_type='application/json', headers={'X-Cache': 'hit'})
+
+        try:
+            parsed = await run_in_threadpool(parse_saved_log, upload['path'], upload['formats'])
+        except ValueError as e:  # compressed data corrupt past the part sniffed at upload
+            return FastJSONResponse({'error': str(e)}, status_code=400)
+        result = await complete_analysis(parsed, upload)
+        # Encoding thousands of events is CPU work too; keep it off the loop
+        body = await run_in_threadpool(cache_result, upload['key'], result)
+    finally:
+        release_upload(upload)
+    return Response(body, media_type='application/json', headers={'X-Cache': 'miss'})
+
+
+@app.post('/analyze/path')
+async def analyze_path(path: str = Form(...), playbook: UploadFile | None = None,
+                       run_async: bool = Query(False, alias='async'),
+                       log_format: str | None = Query(None, alias='format')):
+    """Analyze a log already on the server, without uploading or copying it.
+
+    Only files inside ANALYZE_PATH_DIRS are allowed (403 otherwise).
+    Plain logs are memory-mapped and scanned in place; events keep byte
+    offsets into the file instead of copies of their lines. Compressed
+    logs and archives work as for POST /analyze, as do ?format= and
+    ?async=1. The result cache is keyed by the file's inode, size and
+    mtime rather than its hash.
+    """
+    try:
+        formats = parse_format_param(log_format)
+    except ValueError as e:
+        return FastJSONResponse({'error': str(e)}, status_code=400)
+    if run_async and jobs.full():
+        return FastJSONResponse({'error': 'Analysis queue is full, retry later'}, status_code=503,
+                            headers={'Retry-After': '30'})
+    try:
+        upload = await run_in_threadpool(_prepare_server_log, path, playbook.file if playbook else None, formats)
+    except PermissionError as e:
+        return FastJSONResponse({'error': str(e)}, status_code=403)
+    except FileNotFoundError as e:
+        return FastJSONResponse({'error': str(e)}, status_code=404)
+    except ValueError as e:
+        return FastJSONResponse({'error': str(e)}, status_code=400)
+    return await respond_with_analysis(upload, run_async)
+
+
+def sse_message(event, data):
+    """One Server-Sent Events message with a JSON payload."""
+    return f"event: {event}\ndata: {encode_json(data).decode('utf-8')}\n\n"
+
+
+class IncrementalAnalysis:
+    """Parse a stored upload a few chunks at a time, detecting as it goes.
+
+    Each step() parses for about STREAM_PROGRESS_INTERVAL seconds, feeds
+    the new events to a Detector and returns the running counts plus the
+    findings whose windows closed meanwhile. Bursts are reported as soon as
+    the log's own clock passes their window, so for time-ordered logs the
+    first findings arrive long before the upload is fully parsed.
+    """
+
+    def __init__(self, filepath, formats):
+        self.raw, self.file, compression = open_log(filepath)
+        self.bytes_total = os.fstat(self.raw.fileno()).st_size
+        # As stored, i.e. compressed bytes for a compressed upload
+        self.bytes_read = 0
+        # Offsets into a compressed file are useless; keep the matched lines instead
+        self.stream = StreamParser(formats, source=filepath if compression is None else None)
+        self.detector = Detector(self.stream.events)
+        self.failed = 0
+        self.success = 0
+        self.fed = 0
+        self.eof = False
+
+    def progress(self):
+        events = len(self.stream.events)
+        return {
+            'bytes_parsed': self.bytes_read,
+            'bytes_total': self.bytes_total,
+            'lines': self.stream.lines_parsed,
+            'events': events,
+            'failed': self.failed,
+            'success': self.success,
+        }
+
+    def _detect(self):
+        table = self.stream.events
+        found = []
+        for i in range(self.fed, len(table)):
+            if table.kind[i] & FAILED:
+                self.failed += 1
+            elif table.kind[i] & SUCCESS:
+                self.success += 1
+            found.extend(self.detector.add(i))
+        self.fed = len(table)
+        return found
+
+    def step(self):
+        """Parse for one progress interval; returns the findings completed meanwhile."""
+        deadline = time.monotonic() + STREAM_PROGRESS_INTERVAL
+        found = []
+        while not self.eof and time.monotonic() < deadline:
+            chunk = self.file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                self.eof = True
+                break
+            self.bytes_read = self.raw.tell()
+            self.stream.feed(chunk)
+            found.extend(self._detect())
+            found.extend(self.detector.poll())
+        return found
+
+    def finish(self):
+        """Flush the last line and open bursts; returns (parse result, remaining findings)."""
+        self.close()
+        parsed = self.stream.close()
+        found = self._detect() + self.detector.flush()
+        # The final threat list comes from the full, time-sorted pass
+        analyze_findings(parsed)
+        return parsed, found
+
+    def close(self):
+        self.file.close()
+        self.raw.close()
+
+
+async def analysis_events(upload):
+    """SSE messages for /analyze/stream: progress, findings as they close, then the result."""
+    try:
+        async for message in _analysis_events(upload):
+            yield message
+    finally:
+        release_upload(upload)
+
+
+async def _analysis_events(upload):
+    cached = await run_in_threadpool(get_result, upload['key'])
+    if cached is not None:
+        yield f"event: result\ndata: {cached.decode('utf-8')}\n\n"
+        return
+
+    if upload['archive']:
+        # Members are parsed concurrently, not as one stream: findings come at the end
+        yield sse_message('stage', {'stage': 'parsing'})
         try:
-            a['recs'] = ast.literal_eval(a['recs']) if a['recs'] else []
-        except:
-            a['recs'] = []
-    return {'analyses': analyses}
+            parsed = await run_in_threadpool(parse_saved_log, upload['path'], upload['formats'])
+            for finding in parsed['findings']:
+                yield sse_message('finding', finding)
+            yield sse_message('stage', {'stage': 'enriching'})
+            result = await complete_analysis(parsed, upload)
+            body = await run_in_threadpool(cache_result, upload['key'], result)
+            yield f"event: result\ndata: {body.decode('utf-8')}\n\n"
+        except Exception as e:
+            print(f"Streaming analysis failed: {e}")
+            yield sse_message('error', {'error': str(e)})
+        return
+
+    run = await run_in_threadpool(IncrementalAnalysis, upload['path'], upload['formats'])
+    try:
+        while not run.eof:
+            found = await run_in_threadpool(run.step)
+            for finding in found:
+                yield sse_message('finding', finding)
+            yield sse_message('progress', run.progress())
+
+        parsed, found = await run_in_threadpool(run.finish)
+        for finding in found:
+            yield sse_message('finding', finding)
+        yield sse_message('progress', run.progress())
+        yield sse_message('stage', {'stage': 'enriching'})
+
+        result = await complete_analysis(parsed, upload)
+        body = await run_in_threadpool(cache_result, upload['key'], result)
+        yield f"event: result\ndata: {body.decode('utf-8')}\n\n"
+    except Exception as e:
+        print(f"Streaming analysis failed: {e}")
+        yield sse_message('error', {'error': str(e)})
+    finally:
+        run.close()
+
+
+@app.post('/analyze/stream')
+async def analyze_stream(logfile: UploadFile = File(...), playbook: UploadFile | None = None,
+                         log_format: str | None = Query(None, alias='format')):
+    """Analyze an upload, streaming results as Server-Sent Events.
+
+    Events: `progress` (running byte/line/event and failed/success counts),
+    `finding` (each brute-force burst or post-failure success as soon as it
+    is complete), `stage`, and finally `result` with the same payload as
+    POST /analyze (or `error`). A cached result is sent straight away.
+    ?format= works as for POST /analyze.
+    """
+    try:
+        formats = parse_format_param(log_format)
+    except ValueError as e:
+        return FastJSONResponse({'error': str(e)}, status_code=400)
+    try:
+        upload = await store_uploads(logfile, playbook, formats)
+    except ValueError as e:  # corrupt or truncated compressed data, or zstd without zstandard
+        return FastJSONResponse({'error': str(e)}, status_code=400)
+    return StreamingResponse(
+        analysis_events(upload),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+@app.websocket('/ws/follow')
+async def follow_log(websocket: WebSocket, path: str | None = None, from_start: bool = False):
+    """Tail a server-side log (one of FOLLOW_PATHS) and push findings as they appear.
+
+    Sends {"event": "finding", "data": finding} for each new finding and
+    {"event": "status", "data": counts} after every poll.
+    """
+    path = path or FOLLOW_PATHS[0]
+    allowed = {os.path.realpath(p) for p in FOLLOW_PATHS}
+    if os.path.realpath(path) not in allowed:
+        await websocket.close(code=1008, reason='Path is not in FOLLOW_PATHS')
+        return
+    await websocket.accept()
+    follower = await run_in_threadpool(LogFollower, path, from_start)
+    try:
+        while True:
+            found = await run_in_threadpool(follower.poll)
+            for finding in found:
+                await websocket.send_text(encode_json({'event': 'finding', 'data': finding}).decode('utf-8'))
+            await websocket.send_json({'event': 'status', 'data': follower.status()})
+            await asyncio.sleep(FOLLOW_INTERVAL)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        follower.close()
+
+
+@app.get('/jobs/{job_id}')
+async def get_job(job_id: str):
+    """Progress of a queued analysis (stage, bytes parsed, events found) and its result once done."""
+    job = jobs.get(job_id)
+    if job is None:
+        return FastJSONResponse({'error': 'Job not found'}, status_code=404)
+    return await run_in_threadpool(FastJSONResponse, job.snapshot())
+
+
+def encode_cursor(created_at, analysis_id):
+    return base64.urlsafe_b64encode(f'{created_at}|{analysis_id}'.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Opaque /history cursor -> (created_at, id); ValueError if malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, analysis_id = raw.rsplit('|', 1)
+        return created_at, int(analysis_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('Invalid cursor') from None
+
+
+def parse_fields(fields):
+    if not fields:
+        return DEFAULT_HISTORY_FIELDS
+    wanted = tuple(f.strip() for f in fields.split(',') if f.strip())
+    unknown = [f for f in wanted if f not in HISTORY_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown field(s) {', '.join(unknown)}; choose from {', '.join(HISTORY_FIELDS)}")
+    return wanted
+
+
+@app.get('/history')
+async def get_history(request: Request, limit: int = 50, cursor: str | None = None, fields: str | None = None):
+    """Get past analyses, newest first, one page at a time.
+
+    Pass `next_cursor` from a page as `cursor` to get the next one, and
+    `fields=id,file_path,created_at,preview` to skip full narratives. The
+    ETag changes only when an analysis is added or removed, so polling
+    with If-None-Match costs a 304.
+    """
+    try:
+        before = decode_cursor(cursor) if cursor else None
+        wanted = parse_fields(fields)
+    except ValueError as e:
+        return FastJSONResponse({'error': str(e)}, status_code=400)
+    limit = max(1, min(limit, HISTORY_MAX_LIMIT))
+
+    count, max_id = await ahistory_version()
+    version = f"{count}:{max_id}:{limit}:{cursor}:{','.join(wanted)}"
+    etag = f'W/"{hashlib.sha1(version.encode()).hexdigest()[:20]}"'
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if_none_match = request.headers.get('if-none-match', '')
+    if if_none_match.strip() == '*' or etag in (t.strip() for t in if_none_match.split(',')):
+        return Response(status_code=304, headers=headers)
+
+    analyses = await aget_analyses(limit, before, wanted)
+    next_cursor = None
+    if len(analyses) == limit:
+        next_cursor = encode_cursor(analyses[-1]['created_at'], analyses[-1]['id'])
+    return FastJSONResponse({'analyses': analyses, 'next_cursor': next_cursor, 'total': count}, headers=headers)
 
 
 @app.get('/history/{analysis_id}')
 async def get_history_item(analysis_id: int):
-    """Get a specific analysis by ID."""
-    analysis = get_analysis_by_id(analysis_id)
+    """Get a specific analysis by ID: threats, summary and the first page of events (see /analysis/{id}/events)."""
+    analysis = await aget_analysis_by_id(analysis_id)
     if not analysis:
-        return {'error': 'Analysis not found'}, 404
+        return FastJSONResponse({'error': 'Analysis not found'}, status_code=404)
+    return await run_in_threadpool(FastJSONResponse, analysis)
+
+
+# ?status= values for /analysis/{id}/events
+STATUS_KINDS = {'failed': FAILED, 'success': SUCCESS, 'accepted': SUCCESS, 'local': LOCAL}
+# Events read from the DB per NDJSON chunk
+EVENTS_STREAM_BATCH = 1000
+
+
+def parse_event_filters(status, ip):
+    """?status= and ?ip= -> (kind, packed IPv4 range), either None; ValueError if invalid."""
+    kind = None
+    if status:
+        kind = STATUS_KINDS.get(status.lower())
+        if kind is None:
+            raise ValueError('status must be failed, success or local')
+    return kind, ipv4_range(ip) if ip else None
+
+
+@app.get('/analysis/{analysis_id}/events')
+async def get_analysis_events(analysis_id: int, offset: int = 0, limit: int = EVENTS_PAGE_SIZE,
+                              status: str | None = None, ip: str | None = None, raw: bool = False):
+    """Page through the events of a stored analysis, in log order.
+
+    Large files parsed in parallel keep that order; only the members of a
+    tar archive are merged by timestamp.
+
+    `status` is failed, success or local, `ip` an address or CIDR block; `total`
+    counts every matching event. Raw log lines are only included with
+    ?raw=1; fetch one event's line with ?offset=<its index>&limit=1&raw=1.
+    """
+    try:
+        kind, ip_range = parse_event_filters(status, ip)
+    except ValueError as e:
+        return FastJSONResponse({'error': str(e)}, status_code=400)
+    page = await aget_events(analysis_id, offset, limit, kind, ip_range, raw)
+    if page is None:
+        return FastJSONResponse({'error': 'Analysis not found'}, status_code=404)
+    # Returned as a response so FastAPI does not re-walk it with jsonable_encoder
+    return FastJSONResponse(page)
+
+
+async def ndjson_events(analysis_id, kind, ip_range, raw):
+    """NDJSON lines for /analysis/{id}/events/stream, one DB batch at a time."""
+    start = 0
+    while True:
+        events = await aget_event_batch(analysis_id, start, EVENTS_STREAM_BATCH, kind, ip_range, raw)
+        if not events:
+            return
+        yield b''.join(encode_json(event) + b'\n' for event in events)
+        start = events[-1]['index'] + 1
+
+
+@app.get('/analysis/{analysis_id}/events/stream')
+async def stream_analysis_events(analysis_id: int, status: str | None = None, ip: str | None = None,
+                                 raw: bool = False):
+    """Every matching event of a stored analysis as NDJSON, one event per line.
+
+    Same filters and event shape as /analysis/{id}/events, without paging:
+    events are read from the database in batches as the client consumes
+    them, so a client can process millions of events incrementally.
+    """
+    try:
+        kind, ip_range = parse_event_filters(status, ip)
+    except ValueError as e:
+        return FastJSONResponse({'error': str(e)}, status_code=400)
+    first = await aget_event_batch(analysis_id, 0, 1)
+    if first is None:
+        return FastJSONResponse({'error': 'Analysis not found'}, status_code=404)
+    return StreamingResponse(ndjson_events(analysis_id, kind, ip_range, raw), media_type='application/x-ndjson')
+
+
+def parse_search_time(value, end=False):
+    """ISO date or datetime (log-local time, any offset dropped) -> epoch seconds.
+
+    A bare date as the `end` of a range covers that whole day.
+    """
+    dt = datetime.fromisoformat(value.strip()).replace(tzinfo=None)
+    if end and len(value.strip()) == 10:
+        dt += timedelta(days=1, seconds=-1)
+    return datetime_to_ts(dt)
+
+
+@app.get('/search')
+async def search(ip: str | None = None, user: str | None = None,
+                 start: str | None = Query(None, alias='from'), end: str | None = Query(None, alias='to'),
+                 q: str | None = None, limit: int = 100):
+    """Search events across every stored analysis.
+
+    `ip` is an address or CIDR block (203.0.113.0/24), `from`/`to` are ISO
+    dates or datetimes, and `q` is a phrase matched against raw log lines.
+    Returns the newest matching events and a per-analysis breakdown.
+    """
+    if not any((ip, user, start, end, q)):
+        return FastJSONResponse({'error': 'Give at least one of ip, user, from, to or q'}, status_code=400)
     try:
-        analysis['recs'] = ast.literal_eval(analysis['recs']) if analysis['recs'] else []
-    except:
-        analysis['recs'] = []
-    return analysis
+        ip_range = ipv4_range(ip) if ip else None
+        start_ts = parse_search_time(start) if start else None
+        end_ts = parse_search_time(end, end=True) if end else None
+        return FastJSONResponse(await asearch_events(ip_range, user, start_ts, end_ts, q, limit))
+    except ValueError as e:
+        return FastJSONResponse({'error': str(e)}, status_code=400)
 
 
 if __name__ == '__main__':
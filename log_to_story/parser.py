@@ -1,116 +1,742 @@
-from collections import defaultdict
-import re
-from dateutil import parser as dparser
-from datetime import datetime
+from concurrent.futures import Future, ProcessPoolExecutor
+import argparse
+import io
+import json
+import mmap
+import os
+import threading
+from datetime import date, datetime
+from detectors import Detector
+from collections import deque
+from itertools import chain
+from events import EventTable, NO_IP, NO_TS, datetime_to_ts, ts_to_datetime, pack_ipv4, summarize
+from formats import SNIFF_BYTES, detect_file_formats, detect_formats, get_formats
+from compression import (HEAD_SIZE, decompress_stream, detect_compression, is_tar, iter_tar_members, open_log,
+                         read_head, strip_suffixes)
 
-SSH_FAILED_RE = re.compile(r"(?P<prefix>.*?)?(?P<ts>\w{3}\s+\d{1,2}\s+\d{2}:\d{2}:\d{2}).*?(Failed password|Authentication failure|authentication failure) for(?: invalid user)? (?P<user>\S+) from (?P<ip>\d+\.\d+\.\d+\.\d+)")
-SSH_ACCEPTED_RE = re.compile(r"(?P<prefix>.*?)?(?P<ts>\w{3}\s+\d{1,2}\s+\d{2}:\d{2}:\d{2}).*?(Accepted password|session opened for user|Accepted publickey) for (?P<user>\S+) from (?P<ip>\d+\.\d+\.\d+\.\d+)")
+# Part of the result-cache key; bump whenever parsing or detection output changes
+PARSER_VERSION = 5
 
-def _parse_syslog_ts(ts_str):
-    # syslog has no year; assume current year
-    try:
-        year = datetime.now().year
-        dt = dparser.parse(f"{ts_str} {year}")
-        return dt
-    except Exception:
+MONTHS = {m: i for i, m in enumerate(
+    ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'), 1)}
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+class TimestampDecoder:
+    """Decode the timestamps of one log stream into epoch seconds.
+
+    Syslog timestamps carry no year, so the decoder infers one: the stream
+    starts in the year of `now` (or the year before, if its first month is
+    still ahead of `now`), and the year advances whenever the month jumps
+    back by more than six, e.g. Dec -> Jan. ISO timestamps carry their own
+    year and re-anchor the inference, as do web access log timestamps
+    ("10/Oct/2000:13:55:36 -0700"). Offsets are dropped, keeping the
+    wall-clock time as written, so every format lands on one naive time axis.
+
+    Identical timestamp strings are memoized; logs repeat the same second
+    many times in a row.
+    """
+
+    MEMO_SIZE = 4096
+
+    def __init__(self, now=None):
+        self._now = now or datetime.now()
+        self.year = None
+        self._last_month = None
+        self._memo = {}
+        # (year, month, from_iso) of the first decoded timestamp
+        self.anchor = None
+
+    def __call__(self, ts_str):
+        ts = self._memo.get(ts_str)
+        if ts is not None:
+            return ts
+        if ts_str[4:5] == '-':
+            ts = self._decode_iso(ts_str)
+        elif ts_str[2:3] == '/':
+            ts = self._decode_clf(ts_str)
+        else:
+            ts = self._decode_syslog(ts_str)
+        if ts is not None:
+            if len(self._memo) >= self.MEMO_SIZE:
+                self._memo.clear()
+            self._memo[ts_str] = ts
+        return ts
+
+    def _decode_syslog(self, ts_str):
+        try:
+            mon, day, hms = ts_str.split()
+            month = MONTHS[mon]
+            if month != self._last_month:
+                if self.year is None:
+                    self.year = self._now.year - 1 if month > self._now.month else self._now.year
+                    self.anchor = (self.year, month, False)
+                elif month + 6 < self._last_month:
+                    self.year += 1
+                # memoized values are only valid within one month of one year
+                self._memo.clear()
+                self._last_month = month
+            hh, mm, ss = int(hms[0:2]), int(hms[3:5]), int(hms[6:8])
+            if hh > 23 or mm > 59 or ss > 59:
+                return None
+            days = date(self.year, month, int(day)).toordinal() - _EPOCH_ORDINAL
+            return days * 86400 + hh * 3600 + mm * 60 + ss
+        except (KeyError, ValueError):
+            return None
+
+    def _decode_iso(self, ts_str):
+        try:
+            dt = datetime.fromisoformat(ts_str.replace(',', '.')).replace(tzinfo=None)
+        except ValueError:
+            return None
+        return self._anchor_to(dt)
+
+    def _decode_clf(self, ts_str):
+        try:
+            day, mon, rest = ts_str.split('/', 2)
+            dt = datetime(int(rest[0:4]), MONTHS[mon], int(day), int(rest[5:7]), int(rest[8:10]), int(rest[11:13]))
+        except (KeyError, ValueError):
+            return None
+        return self._anchor_to(dt)
+
+    def _anchor_to(self, dt):
+        """Epoch seconds of a timestamp that carries its year, re-anchoring the inference."""
+        if (dt.year, dt.month) != (self.year, self._last_month):
+            self._memo.clear()
+        if self.anchor is None:
+            self.anchor = (dt.year, dt.month, True)
+        self.year = dt.year
+        self._last_month = dt.month
+        return datetime_to_ts(dt)
+
+
+class StreamParser:
+    """Incremental auth-log parser producing an EventTable.
+
+    Feed it raw byte chunks as they arrive (``feed``) or whole lines
+    (``feed_line``); memory is bounded by the events kept, not the input size.
+    `formats` names the registered log formats to decode (see formats.py);
+    if None they are detected from the first chunk fed, with `name` (the
+    upload's file name) as a hint.
+
+    If `source` (a path or bytes buffer holding the same stream) is given,
+    events record their byte offsets into it; otherwise matched lines are
+    copied into the table's raw buffer. `start_offset` is the stream
+    position of the first byte fed.
+    """
+
+    IP_CACHE_SIZE = 65536
+
+    def __init__(self, formats=None, source=None, start_offset=0, name=None):
+        self.events = EventTable(source)
+        self.bytes_parsed = 0
+        self.lines_parsed = 0
+        self.formats = None
+        self._name = name
+        self._decoders = ()
+        self._decode = None
+        self._prefilters = ()
+        self._pending = b''
+        self._offset = start_offset
+        self._decode_ts = TimestampDecoder()
+        self._ips = {}
+        if formats is not None:
+            self.use_formats(formats)
+
+    def use_formats(self, names):
+        """Decode with the named formats from now on."""
+        fmts = get_formats(names)
+        self.formats = tuple(fmt.name for fmt in fmts)
+        # One format without a prefilter means every line has to be decoded
+        self._prefilters = () if any(not fmt.prefilter for fmt in fmts) else \
+            tuple(dict.fromkeys(p for fmt in fmts for p in fmt.prefilter))
+        # feed() has already applied the union; a decoder whose own prefilter
+        # is that union (always the case for a single format) skips the check
+        self._decoders = [(() if fmt.prefilter == self._prefilters else fmt.prefilter, fmt.decode) for fmt in fmts]
+        self._decode = fmts[0].decode if len(fmts) == 1 else None
+
+    def feed(self, chunk):
+        """Consume a chunk of bytes, parsing every complete line in it."""
+        if not chunk:
+            return
+        self.bytes_parsed += len(chunk)
+        data = self._pending + chunk if self._pending else chunk
+        if self.formats is None:
+            self.use_formats(detect_formats(data, self._name))
+        lines = data.split(b'\n')
+        self._pending = lines.pop()
+        prefilters = self._prefilters
+        offset = self._offset
+        if len(prefilters) == 1:
+            prefilter = prefilters[0]
+            for raw in lines:
+                if prefilter in raw:
+                    self._feed_raw(raw, offset)
+                else:
+                    # cannot be an event of the log's format; skip the decode
+                    self.lines_parsed += 1
+                offset += len(raw) + 1
+        elif prefilters:
+            for raw in lines:
+                for prefilter in prefilters:
+                    if prefilter in raw:
+                        self._feed_raw(raw, offset)
+                        break
+                else:
+                    self.lines_parsed += 1
+                offset += len(raw) + 1
+        else:
+            for raw in lines:
+                self._feed_raw(raw, offset)
+                offset += len(raw) + 1
+        self._offset = offset
+
+    def feed_line(self, line):
+        """Consume one text line (without its newline)."""
+        if self.formats is None:
+            self.use_formats(detect_formats(line, self._name))
+        raw = line.encode('utf-8')
+        self._feed_raw(raw, self._offset)
+        self._offset += len(raw) + 1
+
+    def _feed_raw(self, raw, offset):
+        self.lines_parsed += 1
+        line = raw.decode('utf-8', errors='ignore').rstrip('\r')
+
+        if self._decode is not None:
+            hit = self._decode(line)
+        else:
+            hit = self._decode_any(raw, line)
+        if hit is None:
+            return
+        kind, ts, user, ip = hit
+        if ip is None:
+            ip_n = NO_IP
+        else:
+            ip_n = self._ips.get(ip)
+            if ip_n is None:
+                ip_n = pack_ipv4(ip)
+                if ip_n is None:
+                    return
+                if len(self._ips) >= self.IP_CACHE_SIZE:
+                    self._ips.clear()
+                self._ips[ip] = ip_n
+        if not isinstance(ts, int):
+            ts = self._decode_ts(ts)
+        self.events.append(kind, NO_TS if ts is None else ts, user, ip_n, offset, len(raw), raw)
+
+    def scan(self, buf, start=0, end=None):
+        """Parse buf[start:end] (bytes or an mmap) by jumping between prefilter hits.
+
+        Instead of splitting every line, the buffer is searched for the
+        formats' prefilter bytes and only the lines around the hits are
+        copied out and decoded, so lines that cannot be events are never
+        turned into Python objects. Offsets are positions in `buf`;
+        `start` must be at a line start and a last line without a newline
+        is parsed too. Formats without a prefilter fall back to feed().
+        lines_parsed only counts the lines decoded.
+        """
+        end = len(buf) if end is None else end
+        if self.formats is None:
+            self.use_formats(detect_formats(buf[start:min(end, start + SNIFF_BYTES)], self._name))
+        self._offset = start
+        prefilters = self._prefilters
+        if not prefilters:
+            view = memoryview(buf)
+            try:
+                for pos in range(start, end, _READ_SIZE):
+                    self.feed(bytes(view[pos:min(pos + _READ_SIZE, end)]))
+            finally:
+                view.release()
+            self.flush()
+            return
+
+        self.bytes_parsed += end - start
+        find, rfind, feed_raw = buf.find, buf.rfind, self._feed_raw
+        if len(prefilters) == 1:
+            prefilter = prefilters[0]
+            hit = find(prefilter, start, end)
+            pos = start
+            while hit >= 0:
+                line_start = rfind(b'\n', pos, hit) + 1 or pos
+                line_end = find(b'\n', hit, end)
+                if line_end < 0:
+                    line_end = end
+                feed_raw(buf[line_start:line_end], line_start)
+                pos = line_end + 1
+                hit = find(prefilter, pos, end)
+            self._offset = end
+            return
+
+        hits = {p: find(p, start, end) for p in prefilters}
+        pos = start
+        while True:
+            hit = min((h for h in hits.values() if h >= 0), default=-1)
+            if hit < 0:
+                break
+            line_start = rfind(b'\n', pos, hit) + 1 or pos
+            line_end = find(b'\n', hit, end)
+            if line_end < 0:
+                line_end = end
+            feed_raw(buf[line_start:line_end], line_start)
+            pos = line_end + 1
+            for p, h in hits.items():
+                if 0 <= h < pos:
+                    hits[p] = find(p, pos, end)
+        self._offset = end
+
+    def _decode_any(self, raw, line):
+        """First hit among several formats' decoders, each behind its own prefilter."""
+        for prefilter, decode in self._decoders:
+            if prefilter:
+                for p in prefilter:
+                    if p in raw:
+                        break
+                else:
+                    continue
+            hit = decode(line)
+            if hit is not None:
+                return hit
         return None
 
-def parse_log(text):
-    """Parse auth/syslog-like text and return summarized events.
+    @property
+    def position(self):
+        """Stream offset just past the last complete line fed."""
+        return self._offset
+
+    def rewind(self, offset=0):
+        """Continue at `offset` of a new or truncated stream, dropping any partial line."""
+        self._pending = b''
+        self._offset = offset
+
+    def flush(self):
+        """Parse a trailing partial line as if it ended the stream."""
+        if self._pending:
+            pending, self._pending = self._pending, b''
+            self._feed_raw(pending, self._offset)
+            self._offset += len(pending)
+
+    def close(self):
+        """Flush any trailing partial line and return the parse result."""
+        self.flush()
+        return {'events': self.events, 'summary': summarize(self.events), 'formats': self.formats or ()}
+
+
+_READ_SIZE = 1024 * 1024
+
+
+def parse_log(source, formats=None, name=None):
+    """Parse auth/syslog-like input and return summarized events.
+
+    `source` may be a str, bytes, a text or binary file object, or any
+    iterable of lines; it is consumed one line (or one chunk) at a time.
+    Raw lines point back into bytes input or an on-disk binary file
+    instead of being copied. `formats` (names) defaults to what the first
+    SNIFF_BYTES of the input look like; `name` is a file name hint.
 
     Returns dict with:
-    - events: list of parsed events
-    - summary: aggregated counts by user/ip
+    - events: EventTable of parsed events
+    - summary: aggregated counts and top-k IPs/users (see events.summarize)
+    - formats: the format names used
+    """
+    if isinstance(source, (bytes, bytearray)):
+        sp = StreamParser(formats, source=source, name=name)
+        view = memoryview(source)
+        for i in range(0, len(view), _READ_SIZE):
+            sp.feed(bytes(view[i:i + _READ_SIZE]))
+        return sp.close()
+
+    if isinstance(source, str):
+        source = io.StringIO(source)
+    elif hasattr(source, 'read') and not isinstance(source, io.TextIOBase):
+        path = getattr(source, 'name', None)
+        # A decompressing reader has its file's name too, but not its offsets
+        on_disk = (isinstance(source, (io.BufferedReader, io.FileIO))
+                   and isinstance(path, str) and os.path.isfile(path))
+        name = name or (path if on_disk else None)
+        sp = StreamParser(formats, source=path if on_disk else None,
+                          start_offset=source.tell() if on_disk else 0, name=name)
+        while True:
+            chunk = source.read(_READ_SIZE)
+            if not chunk:
+                break
+            sp.feed(chunk)
+        return sp.close()
+
+    lines = (line.decode('utf-8', errors='ignore') if isinstance(line, (bytes, bytearray)) else line
+             for line in source)
+    if formats is None:
+        head = []
+        size = 0
+        for line in lines:
+            head.append(line)
+            size += len(line)
+            if size >= SNIFF_BYTES:
+                break
+        formats = detect_formats(''.join(head), name)
+        lines = chain(head, lines)
+    sp = StreamParser(formats)
+    for line in lines:
+        sp.feed_line(line.rstrip('\r\n'))
+    return sp.close()
+
+
+# Bytes scanned by parse_mapped() between progress callbacks
+MAPPED_SEGMENT = 64 * 1024 * 1024
+
+# Parallel parsing of files on disk
+PARSE_WORKERS = int(os.getenv('PARSE_WORKERS', str(os.cpu_count() or 1)))
+# Smallest byte range worth shipping to a worker process
+PARALLEL_MIN_CHUNK = 8 * 1024 * 1024
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers):
+    """Return the shared worker pool, with at least `workers` processes.
+
+    Callers bound their own in-flight work, so a larger pool is reused as
+    is. A smaller one is replaced but not shut down, since another request
+    may still be submitting to it; the executor stops its workers once the
+    last reference to it is gone.
     """
-    events = []
-    summary = {
-        'failed_by_user': defaultdict(int),
-        'failed_by_ip': defaultdict(int),
-        'success_by_user': defaultdict(int),
-        'success_by_ip': defaultdict(int),
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers < workers:
+            _pool = ProcessPoolExecutor(max_workers=workers)
+            _pool_workers = workers
+        return _pool
+
+
+def shutdown_pool():
+    """Stop the parse worker processes, if any were started."""
+    global _pool, _pool_workers
+    with _pool_lock:
+        pool, _pool, _pool_workers = _pool, None, 0
+    if pool is not None:
+        pool.shutdown(wait=True)
+
+
+def split_ranges(path, parts):
+    """Split a file into at most `parts` byte ranges that start and end on line boundaries."""
+    size = os.path.getsize(path)
+    cuts = [0]
+    with open(path, 'rb') as f:
+        for i in range(1, parts):
+            f.seek(max(size * i // parts, cuts[-1]))
+            f.readline()
+            pos = f.tell()
+            if pos >= size:
+                break
+            if pos > cuts[-1]:
+                cuts.append(pos)
+    cuts.append(size)
+    return [(cuts[i], cuts[i + 1]) for i in range(len(cuts) - 1) if cuts[i + 1] > cuts[i]]
+
+
+def _parse_range(path, start, end, formats):
+    """Worker: parse bytes [start, end) of `path` through a shared read-only map."""
+    sp = StreamParser(formats, source=path, start_offset=start)
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        sp.scan(mm, start, min(end, len(mm)))
+    sp.close()
+    state = (sp._decode_ts.anchor, sp._decode_ts.year, sp._decode_ts._last_month)
+    return sp.events, state
+
+
+def _rebase_years(table, shift):
+    ts = table.ts
+    for i in range(len(ts)):
+        if ts[i] != NO_TS:
+            dt = ts_to_datetime(ts[i])
+            try:
+                ts[i] = datetime_to_ts(dt.replace(year=dt.year + shift))
+            except ValueError:  # Feb 29 in a non-leap year
+                ts[i] = NO_TS
+
+
+def parse_file_parallel(path, workers=None, formats=None, name=None):
+    """Parse a log file on disk across a pool of worker processes.
+
+    The file is split at newline boundaries into byte ranges that are parsed
+    concurrently. The ranges are concatenated in file order, so events come
+    out in log order exactly as from a single pass, and are summarized once
+    merged. Syslog years are re-based so every range continues the year
+    inference of the one before it.
+
+    The formats are detected once from the head of the file (with `name`
+    as the file name hint) unless given. Small files, or `workers` <= 1,
+    are parsed in-process.
+    """
+    workers = workers or PARSE_WORKERS
+    formats = tuple(formats or detect_file_formats(path, name))
+    parts = min(workers, max(1, os.path.getsize(path) // PARALLEL_MIN_CHUNK))
+    if parts <= 1:
+        with open(path, 'rb') as f:
+            return parse_log(f, formats)
+
+    ranges = split_ranges(path, parts)
+    pool = _get_pool(workers)
+    futures = [pool.submit(_parse_range, path, start, end, formats) for start, end in ranges]
+    chunks = [fut.result() for fut in futures]
+
+    year = last_month = None
+    for table, (anchor, end_year, end_month) in chunks:
+        if anchor is not None:
+            first_year, first_month, from_iso = anchor
+            if year is not None and not from_iso:
+                expected = year + 1 if first_month + 6 < last_month else year
+                if expected != first_year:
+                    _rebase_years(table, expected - first_year)
+                    end_year += expected - first_year
+            year, last_month = end_year, end_month
+
+    events = EventTable.concat([c[0] for c in chunks])
+    return {'events': events, 'summary': summarize(events), 'formats': formats}
+
+
+def parse_mapped(path, formats=None, name=None, progress=None):
+    """Parse a plain log on disk through mmap, without reading it into memory.
+
+    The file is scanned for the formats' prefilters in place (see
+    StreamParser.scan); events keep byte offsets into `path`, so memory
+    grows with the number of events, not the size of the file.
+    `progress(bytes scanned, events)` is called every MAPPED_SEGMENT bytes.
+    """
+    sp = StreamParser(formats, source=path, name=name or path)
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:  # empty files cannot be mapped
+            return sp.close()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            mm.madvise(mmap.MADV_SEQUENTIAL)
+            pos = 0
+            while pos < size:
+                # segments end on a line boundary, so no line is split
+                end = mm.find(b'\n', min(pos + MAPPED_SEGMENT, size) - 1) + 1 or size
+                sp.scan(mm, pos, end)
+                pos = end
+                if progress is not None:
+                    progress(pos, len(sp.events))
+    return sp.close()
+
+
+# Compressed logs and tar archives
+
+# Tar members parsed ahead of the one being collected, per worker; bounds
+# memory to about that many members' bytes
+ARCHIVE_INFLIGHT_PER_WORKER = 2
+# Larger members are parsed in-process straight from the archive stream
+# rather than read into memory and sent to a worker
+ARCHIVE_MEMBER_MAX_BYTES = 64 * 1024 * 1024
+
+
+def inspect_log(path, name=None):
+    """(compression, formats) of a log on disk, looking through compression.
+
+    formats is None for a tar archive, whose members are sniffed one by one.
+    """
+    with open(path, 'rb') as f:
+        compression = detect_compression(f.read(HEAD_SIZE))
+    head = read_head(path, SNIFF_BYTES)
+    if is_tar(head):
+        return compression, None
+    return compression, detect_formats(head, strip_suffixes(name or path))
+
+
+def _feed_stream(sp, reader, progress=None, raw=None):
+    while True:
+        chunk = reader.read(_READ_SIZE)
+        if not chunk:
+            return
+        sp.feed(chunk)
+        if progress is not None:
+            progress(raw.tell(), len(sp.events))
+
+
+def parse_compressed(path, formats=None, name=None, progress=None):
+    """Parse a gzip/bz2/xz/zstd log, decompressing on the fly.
+
+    Matched lines are copied into the table (offsets into the compressed
+    file would be useless). `progress(compressed bytes read, events)` is
+    called after every chunk.
+    """
+    raw, reader, _ = open_log(path)
+    try:
+        sp = StreamParser(formats, name=strip_suffixes(name or path))
+        _feed_stream(sp, reader, progress, raw)
+        return sp.close()
+    finally:
+        if reader is not raw:
+            reader.close()
+        raw.close()
+
+
+def _parse_member(data, name, formats):
+    """Worker: parse one tar member read into memory."""
+    return _parse_member_stream(io.BytesIO(data), data[:HEAD_SIZE], name, formats)
+
+
+def _parse_member_stream(fileobj, head, name, formats):
+    """Parse one tar member, itself possibly compressed, given its first bytes. None for binary files."""
+    reader = decompress_stream(fileobj, detect_compression(head))
+    head = reader.read(SNIFF_BYTES)
+    if b'\0' in head:
+        return None  # wtmp, btmp, journal files
+    sp = StreamParser(formats, name=strip_suffixes(name))
+    sp.feed(head)
+    _feed_stream(sp, reader)
+    parsed = sp.close()
+    return parsed['events'], parsed['formats']
+
+
+def parse_archive(path, workers=None, formats=None, progress=None):
+    """Parse every text log in a tar archive (plain or compressed).
+
+    The archive is read once, front to back; members are parsed
+    concurrently across the process pool while later ones are still being
+    read. Members over ARCHIVE_MEMBER_MAX_BYTES are parsed in this process
+    from the archive stream, so no member is ever held in memory whole.
+    Each member is sniffed for its own formats unless `formats` is
+    given. Events are merged by timestamp; the result lists the members
+    parsed under `members`.
+    """
+    workers = workers or PARSE_WORKERS
+    pool = _get_pool(workers) if workers > 1 else None
+    raw, reader, _ = open_log(path)
+    pending = deque()
+    members = []
+
+    def collect():
+        name, fut = pending.popleft()
+        members.append((name, fut.result()))
+
+    try:
+        for name, size, member in iter_tar_members(reader):
+            if pool is None or size > ARCHIVE_MEMBER_MAX_BYTES:
+                # Queued as a finished future so members keep archive order
+                fut = Future()
+                fut.set_result(_parse_member_stream(member, member.peek(HEAD_SIZE)[:HEAD_SIZE], name, formats))
+                pending.append((name, fut))
+            else:
+                data = member.read()
+                pending.append((name, pool.submit(_parse_member, data, name, formats)))
+            while pending and (pending[0][1].done() or len(pending) >= workers * ARCHIVE_INFLIGHT_PER_WORKER):
+                collect()
+            if progress is not None:
+                progress(raw.tell(), sum(len(res[0]) for _, res in members if res is not None))
+        while pending:
+            collect()
+    finally:
+        for _, fut in pending:
+            fut.cancel()
+        if reader is not raw:
+            reader.close()
+        raw.close()
+
+    parsed = [(name, res) for name, res in members if res is not None]
+    events = EventTable.concat([res[0] for _, res in parsed]).sorted_by_ts()
+    return {
+        'events': events,
+        'summary': summarize(events),
+        'formats': tuple(dict.fromkeys(f for _, res in parsed for f in res[1])),
+        'members': [{'name': name, 'formats': res[1], 'events': len(res[0])} for name, res in parsed],
     }
 
-    for line in text.splitlines():
-        m = SSH_FAILED_RE.search(line)
-        if m:
-            ts = _parse_syslog_ts(m.group('ts'))
-            user = m.group('user')
-            ip = m.group('ip')
-            events.append({'type':'failed', 'ts':ts, 'user':user, 'ip':ip, 'raw':line})
-            summary['failed_by_user'][user] += 1
-            summary['failed_by_ip'][ip] += 1
-            continue
-
-        m2 = SSH_ACCEPTED_RE.search(line)
-        if m2:
-            ts = _parse_syslog_ts(m2.group('ts'))
-            user = m2.group('user')
-            ip = m2.group('ip')
-            events.append({'type':'success', 'ts':ts, 'user':user, 'ip':ip, 'raw':line})
-            summary['success_by_user'][user] += 1
-            summary['success_by_ip'][ip] += 1
-            continue
-
-    return {'events': events, 'summary': summary}
+
+# Plain files at least this large are split across the process pool
+PARALLEL_MIN_BYTES = 2 * PARALLEL_MIN_CHUNK
+
+
+def parse_path(path, formats=None, name=None, workers=None, progress=None, parallel_min_bytes=PARALLEL_MIN_BYTES):
+    """Parse a log on disk, whatever it is: plain, compressed or a tar archive.
+
+    Compression (gzip, bz2, xz, zstd) is detected by magic bytes and
+    decompressed in a streaming pipeline, without a temporary copy.
+    Archives go through parse_archive(), plain files of
+    `parallel_min_bytes` or more through parse_file_parallel(), smaller
+    ones through parse_mapped().
+    `progress(bytes read, events)` is called as the input is consumed,
+    except while a plain file is parsed in parallel.
+    """
+    workers = workers or PARSE_WORKERS
+    with open(path, 'rb') as f:
+        head = f.read(HEAD_SIZE)
+    compression = detect_compression(head)
+    if compression is not None:
+        head = read_head(path, HEAD_SIZE)
+    if is_tar(head):
+        return parse_archive(path, workers, formats, progress)
+    if compression is not None:
+        return parse_compressed(path, formats, name, progress)
+
+    if workers > 1 and os.path.getsize(path) >= parallel_min_bytes:
+        return parse_file_parallel(path, workers, formats, name)
+    return parse_mapped(path, formats, name, progress)
 
 
 def analyze_findings(parse_result, failed_threshold=5, window_minutes=5):
     """Analyze parsed events for patterns (brute force, post-failure success).
 
+    Runs the sliding-window Detector over the events in timestamp order.
+    Findings are grouped as IP bursts, user bursts, then post-failure
+    successes, each in chronological order.
+
     Adds a `findings` list to the parse_result and returns it.
     """
-    from datetime import timedelta
+    table = parse_result['events']
+    ts = table.ts
+    detector = Detector(table, failed_threshold, window_minutes)
 
-    events = [e for e in parse_result['events'] if e.get('ts')]
-    events.sort(key=lambda x: x['ts'])
     findings = []
+    for i in sorted((i for i in range(len(table)) if ts[i] != NO_TS), key=ts.__getitem__):
+        findings.extend(detector.add(i))
+    findings.extend(detector.flush())
 
-    # Detect many failed attempts from same IP or for same user within sliding window
-    by_ip = defaultdict(list)
-    by_user = defaultdict(list)
-    for e in events:
-        if e['type'] == 'failed':
-            by_ip[e['ip']].append(e)
-            by_user[e['user']].append(e)
-
-    def detect_burst(bucket, key_name):
-        for key, evs in bucket.items():
-            start = 0
-            for i in range(len(evs)):
-                # advance start while window too large
-                while evs[i]['ts'] - evs[start]['ts'] > timedelta(minutes=window_minutes):
-                    start += 1
-                count = i - start + 1
-                if count >= failed_threshold:
-                    findings.append({
-                        'type': 'brute_force',
-                        'target': key,
-                        'target_type': key_name,
-                        'count': count,
-                        'start_ts': evs[start]['ts'],
-                        'end_ts': evs[i]['ts'],
-                        'description': f"{count} failed logins for {key_name} {key} between {evs[start]['ts']} and {evs[i]['ts']}"
-                    })
-                    break
-
-    detect_burst(by_ip, 'ip')
-    detect_burst(by_user, 'user')
-
-    # Detect success following failures from same IP within window
-    successes = [e for e in events if e['type'] == 'success']
-    for s in successes:
-        ip = s['ip']
-        recent_fails = [f for f in by_ip.get(ip, []) if 0 <= (s['ts'] - f['ts']).total_seconds() <= window_minutes * 60]
-        if recent_fails:
-            findings.append({
-                'type': 'post_failure_success',
-                'ip': ip,
-                'user': s['user'],
-                'success_ts': s['ts'],
-                'fail_count': len(recent_fails),
-                'description': f"Successful login for {s['user']} from {ip} at {s['ts']} after {len(recent_fails)} recent failures"
-            })
-
+    findings.sort(key=_finding_order)
     parse_result['findings'] = findings
     return findings
 
+
+_FINDING_GROUPS = {('brute_force', 'ip'): 0, ('brute_force', 'user'): 1, ('post_failure_success', None): 2}
+
+
+def _finding_order(f):
+    return _FINDING_GROUPS.get((f['type'], f.get('target_type')), 3), f.get('start_ts') or f.get('success_ts')
+
+
+def main():
+    ap = argparse.ArgumentParser(
+        description='Parse auth logs (plain, gzip/bz2/xz/zstd or tar archives) and print the findings.')
+    ap.add_argument('paths', nargs='+')
+    ap.add_argument('--format', help='comma-separated log formats (default: detected per file)')
+    ap.add_argument('--workers', type=int, default=PARSE_WORKERS, help='parse worker processes')
+    ap.add_argument('--threshold', type=int, default=5, help='failed logins per window for a burst')
+    ap.add_argument('--window', type=int, default=5, help='window in minutes')
+    ap.add_argument('--json', action='store_true', help='print one JSON object per file')
+    args = ap.parse_args()
+    formats = tuple(f.strip() for f in args.format.split(',')) if args.format else None
+
+    try:
+        for path in args.paths:
+            parsed = parse_path(path, formats, workers=args.workers)
+            findings = analyze_findings(parsed, args.threshold, args.window)
+            if args.json:
+                print(json.dumps({'path': path, 'formats': parsed['formats'], 'summary': parsed['summary'],
+                                  'members': parsed.get('members'), 'findings': findings}, default=str))
+                continue
+            summary = parsed['summary']
+            print(f"{path}: {summary['total_events']} events ({summary['failed_attempts']} failed) "
+                  f"[{', '.join(parsed['formats']) or 'no events'}]")
+            for member in parsed.get('members', ()):
+                print(f"  {member['name']}: {member['events']} events [{', '.join(member['formats'])}]")
+            for finding in findings:
+                print(f"  {finding['description']}")
+    finally:
+        shutdown_pool()
+
+
+if __name__ == '__main__':
+    main()
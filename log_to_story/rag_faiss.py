@@ -1,6 +1,9 @@
 import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
 from sentence_transformers import SentenceTransformer
-import pickle
 import numpy as np
 
 try:
@@ -11,16 +14,34 @@ except Exception:
 
 MODEL_NAME = 'all-MiniLM-L6-v2'
 
+# Number of distinct playbooks (by content hash) kept embedded in memory
+INDEX_CACHE_SIZE = int(os.getenv('PLAYBOOK_CACHE_SIZE', '8'))
 
-def _ensure_model():
-    return SentenceTransformer(MODEL_NAME)
+# On-disk index store, shared by all workers and reused across restarts
+INDEX_DIR = os.getenv('PLAYBOOK_INDEX_DIR',
+                      os.path.join(os.path.dirname(os.path.abspath(__file__)), 'index_cache'))
 
+_model = None
+_model_lock = threading.Lock()
+_index_cache = OrderedDict()
+_index_cache_lock = threading.Lock()
+# (playbook key, query, top_k) -> docs; queries are small, repeated finding-type sets
+QUERY_CACHE_SIZE = int(os.getenv('PLAYBOOK_QUERY_CACHE_SIZE', '1024'))
+_query_cache = OrderedDict()
+_query_cache_lock = threading.Lock()
+
+
+def _ensure_model():
+    """Return the process-wide SentenceTransformer, loading it on first use."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                _model = SentenceTransformer(MODEL_NAME)
+    return _model
 
-def build_playbook_index(playbook_path, index_path=None):
-    model = _ensure_model()
-    with open(playbook_path, 'r', encoding='utf-8') as f:
-        text = f.read()
 
+def _split_sections(text):
     # split into sections by '## ' headers
     parts = [p.strip() for p in text.split('##') if p.strip()]
     docs = []
@@ -29,54 +50,179 @@ def build_playbook_index(playbook_path, index_path=None):
         title = lines[0].strip()
         content = '\n'.join(lines[1:]).strip()
         docs.append({'title': title, 'content': content})
+    return docs
+
+
+def _build_index_from_text(text):
+    model = _ensure_model()
+    docs = _split_sections(text)
 
     texts = [d['title'] + '\n' + d['content'] for d in docs]
-    embeddings = model.encode(texts, convert_to_numpy=True)
+    embeddings = model.encode(texts, convert_to_numpy=True).astype(np.float32)
+    return _make_index(docs, embeddings)
+
 
+def _make_index(docs, embeddings):
     if HAS_FAISS:
         dim = embeddings.shape[1]
         index = faiss.IndexFlatL2(dim)
-        index.add(embeddings.astype(np.float32))
-        index_data = {'index': index, 'docs': docs, 'embeddings_shape': embeddings.shape, 'has_faiss': True}
-    else:
-        # Fallback: store embeddings and do numpy-based similarity search at query time
-        index_data = {'embeddings': embeddings, 'docs': docs, 'has_faiss': False}
+        index.add(embeddings)
+        return {'index': index, 'docs': docs, 'embeddings_shape': embeddings.shape, 'has_faiss': True}
+    # Fallback: store embeddings and do numpy-based similarity search at query time
+    return {'embeddings': embeddings, 'docs': docs, 'has_faiss': False}
+
+
+def playbook_key(text):
+    """Content key for a playbook: SHA-256 over the embedding model name and the text."""
+    h = hashlib.sha256()
+    h.update(MODEL_NAME.encode('utf-8'))
+    h.update(b'\0')
+    h.update(text.encode('utf-8'))
+    return h.hexdigest()
+
+
+def _store_paths(key, index_dir):
+    base = os.path.join(index_dir, key)
+    return base + ('.faiss' if HAS_FAISS else '.npy'), base + '.json'
+
+
+def _save_index(key, index_data, index_dir):
+    """Write the vectors and a sidecar JSON of the docs.
+
+    Files are written under per-thread temporary names and renamed into place,
+    metadata last, so a reader never sees a half-written store and two threads
+    building the same playbook never write the same temp file.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    vec_path, meta_path = _store_paths(key, index_dir)
+    tmp_suffix = f'.{os.getpid()}.{threading.get_ident()}.tmp'
+
+    try:
+        if index_data['has_faiss']:
+            faiss.write_index(index_data['index'], vec_path + tmp_suffix)
+        else:
+            with open(vec_path + tmp_suffix, 'wb') as f:
+                np.save(f, index_data['embeddings'])
+    except BaseException:
+        if os.path.exists(vec_path + tmp_suffix):
+            os.remove(vec_path + tmp_suffix)
+        raise
+    os.replace(vec_path + tmp_suffix, vec_path)
+
+    meta = {'model': MODEL_NAME, 'key': key, 'docs': index_data['docs'],
+            'shape': list(index_data.get('embeddings_shape') or index_data['embeddings'].shape)}
+    with open(meta_path + tmp_suffix, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    os.replace(meta_path + tmp_suffix, meta_path)
+
+
+def _load_index(key, index_dir):
+    """Memory-map a stored index, or return None if it is missing or unreadable."""
+    vec_path, meta_path = _store_paths(key, index_dir)
+    if not (os.path.exists(meta_path) and os.path.exists(vec_path)):
+        return None
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('model') != MODEL_NAME or meta.get('key') != key:
+            return None
+        if HAS_FAISS:
+            flag = getattr(faiss, 'IO_FLAG_MMAP_IFC', faiss.IO_FLAG_MMAP)
+            try:
+                index = faiss.read_index(vec_path, flag)
+            except RuntimeError:
+                index = faiss.read_index(vec_path)
+            return {'index': index, 'docs': meta['docs'], 'embeddings_shape': tuple(meta['shape']), 'has_faiss': True}
+        embeddings = np.load(vec_path, mmap_mode='r')
+        return {'embeddings': embeddings, 'docs': meta['docs'], 'has_faiss': False}
+    except Exception as e:
+        print(f"Playbook index store error ({key}): {e}")
+        return None
+
+
+def _cached_index(text, index_dir=None):
+    """Return the index for playbook `text`.
+
+    Lookup order is the in-memory LRU, then the on-disk store, and only then
+    a fresh embedding pass (whose result is written back to both).
+    """
+    index_dir = index_dir or INDEX_DIR
+    key = playbook_key(text)
+    with _index_cache_lock:
+        if key in _index_cache:
+            _index_cache.move_to_end(key)
+            return _index_cache[key]
+
+    index_data = _load_index(key, index_dir)
+    if index_data is None:
+        index_data = _build_index_from_text(text)
+        try:
+            _save_index(key, index_data, index_dir)
+        except (OSError, RuntimeError) as e:
+            # faiss.write_index reports I/O failures as RuntimeError.
+            print(f"Could not persist playbook index: {e}")
+    index_data['key'] = key
+
+    with _index_cache_lock:
+        _index_cache[key] = index_data
+        _index_cache.move_to_end(key)
+        while len(_index_cache) > INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    return index_data
 
-    if index_path:
-        with open(index_path, 'wb') as f:
-            pickle.dump(index_data, f)
 
-    return index_data
+def warm_up(playbook_path=None):
+    """Load the embedding model (and optionally a playbook index) ahead of the first request."""
+    _ensure_model()
+    if playbook_path and os.path.exists(playbook_path):
+        load_playbook_index(playbook_path)
+
+
+def build_playbook_index(playbook_path, index_path=None):
+    """Return the index for the playbook at `playbook_path`.
+
+    `index_path` overrides the index store directory (defaults to INDEX_DIR).
+    """
+    with open(playbook_path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    return _cached_index(text, index_path)
 
 
 def load_playbook_index(path_or_index):
-    # if path to saved index
+    """Load the index for a playbook file; already-built index dicts pass through."""
+    if isinstance(path_or_index, dict):
+        return path_or_index
     if isinstance(path_or_index, str) and os.path.exists(path_or_index):
-        # Check if it's a text-based playbook file (md, txt, or any text file)
-        if path_or_index.endswith(('.md', '.txt', '.markdown')):
-            return build_playbook_index(path_or_index)
-        # Try to detect if it's a text file by reading first bytes
-        try:
-            with open(path_or_index, 'r', encoding='utf-8') as f:
-                content = f.read(100)
-                # If readable as text and looks like text content, treat as playbook
-                if content and not content.startswith(b'\x80'):  # Not a pickle file
-                    return build_playbook_index(path_or_index)
-        except UnicodeDecodeError:
-            pass
-        # Try loading as pickle (cached index)
-        try:
-            with open(path_or_index, 'rb') as f:
-                return pickle.load(f)
-        except Exception:
-            # If pickle fails, try building from text
-            return build_playbook_index(path_or_index)
+        return build_playbook_index(path_or_index)
     return None
 
 
 def query_playbook(index_data, query, top_k=3):
+    """Return the top_k playbook sections for `query`.
+
+    Results are memoized per (playbook, query, top_k), so repeated queries
+    against a cached playbook do no embedding work.
+    """
     if not index_data:
         return []
+    memo_key = (index_data.get('key'), query, top_k)
+    if memo_key[0] is not None:
+        with _query_cache_lock:
+            if memo_key in _query_cache:
+                _query_cache.move_to_end(memo_key)
+                return list(_query_cache[memo_key])
+
+    results = _search(index_data, query, top_k)
+
+    if memo_key[0] is not None:
+        with _query_cache_lock:
+            _query_cache[memo_key] = results
+            while len(_query_cache) > QUERY_CACHE_SIZE:
+                _query_cache.popitem(last=False)
+    return list(results)
+
+
+def _search(index_data, query, top_k):
     model = _ensure_model()
     q_emb = model.encode([query], convert_to_numpy=True)
 
@@ -0,0 +1,189 @@
+"""Content-addressed upload storage and the analysis result cache.
+
+Uploads are streamed to a temp file while being hashed and then renamed
+to uploads/<sha256>, so identical logs are stored once no matter what
+they were called, and different logs with the same name no longer
+overwrite each other.
+
+Finished results are cached as encoded JSON under RESULT_CACHE_DIR,
+keyed by (log hash, playbook hash, parser version); a repeat submission
+is answered from that file without parsing anything.
+
+Both are trimmed by enforce_retention(): files unused for
+STORAGE_MAX_AGE_DAYS go first, then the least recently used until the
+total is under STORAGE_MAX_BYTES. Hits refresh a file's mtime. Uploads
+pinned by a queued or running analysis are never evicted (see pin()).
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+import uuid
+
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+UPLOAD_DIR = os.path.join(APP_ROOT, 'uploads')
+RESULT_CACHE_DIR = os.getenv('RESULT_CACHE_DIR', os.path.join(APP_ROOT, 'result_cache'))
+
+STORAGE_MAX_BYTES = int(os.getenv('STORAGE_MAX_BYTES', str(10 * 1024 ** 3)))
+STORAGE_MAX_AGE = float(os.getenv('STORAGE_MAX_AGE_DAYS', '30')) * 86400
+# Seconds between retention sweeps
+RETENTION_INTERVAL = 60
+# Abandoned partial uploads are removed after this long
+INCOMING_MAX_AGE = 24 * 3600
+
+READ_SIZE = 1024 * 1024
+
+_DIGEST_RE = re.compile(r'^[0-9a-f]{64}(?:\.json)?$')
+_last_sweep = 0.0
+_sweep_lock = threading.Lock()
+# path -> number of analyses still reading it
+_pins = {}
+_pin_lock = threading.Lock()
+
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+os.makedirs(RESULT_CACHE_DIR, exist_ok=True)
+
+
+def blob_path(digest):
+    return os.path.join(UPLOAD_DIR, digest)
+
+
+def pin(path):
+    """Keep `path` out of enforce_retention() until a matching unpin()."""
+    with _pin_lock:
+        _pins[path] = _pins.get(path, 0) + 1
+
+
+def unpin(path):
+    with _pin_lock:
+        count = _pins.get(path, 0) - 1
+        if count > 0:
+            _pins[path] = count
+        else:
+            _pins.pop(path, None)
+
+
+def store_upload(fileobj, pinned=False):
+    """Stream `fileobj` into the upload store; returns (sha256 hex, path).
+
+    With `pinned`, the blob is pinned before it is linked into place, so
+    no sweep can evict it between storing and analyzing; unpin() it after.
+    """
+    tmp = os.path.join(UPLOAD_DIR, f'.incoming-{uuid.uuid4().hex}')
+    h = hashlib.sha256()
+    try:
+        with open(tmp, 'wb') as f:
+            while True:
+                chunk = fileobj.read(READ_SIZE)
+                if not chunk:
+                    break
+                h.update(chunk)
+                f.write(chunk)
+        digest = h.hexdigest()
+        path = blob_path(digest)
+        if pinned:
+            pin(path)
+        try:
+            if os.path.exists(path):
+                os.remove(tmp)
+                os.utime(path)
+            else:
+                os.replace(tmp, path)
+        except BaseException:
+            if pinned:
+                unpin(path)
+            raise
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return digest, path
+
+
+def file_digest(path):
+    """sha256 hex of a file on disk."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(READ_SIZE)
+            if not chunk:
+                return h.hexdigest()
+            h.update(chunk)
+
+
+def result_key(log_digest, playbook_digest, parser_version):
+    return hashlib.sha256(f'{log_digest}\0{playbook_digest}\0{parser_version}'.encode()).hexdigest()
+
+
+def _result_path(key):
+    return os.path.join(RESULT_CACHE_DIR, f'{key}.json')
+
+
+def get_result(key):
+    """Cached encoded result for `key`, or None."""
+    path = _result_path(key)
+    try:
+        with open(path, 'rb') as f:
+            body = f.read()
+    except FileNotFoundError:
+        return None
+    os.utime(path)
+    return body
+
+
+def put_result(key, body):
+    path = _result_path(key)
+    tmp = f'{path}.{uuid.uuid4().hex}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(body)
+    os.replace(tmp, path)
+
+
+def enforce_retention(force=False):
+    """Evict stored uploads and cached results by age, then by total size.
+
+    Sweeps at most once per RETENTION_INTERVAL unless `force`.
+    Returns the number of files removed.
+    """
+    global _last_sweep
+    now = time.time()
+    with _sweep_lock:
+        if not force and now - _last_sweep < RETENTION_INTERVAL:
+            return 0
+        _last_sweep = now
+
+    files = []
+    removed = 0
+    for directory in (UPLOAD_DIR, RESULT_CACHE_DIR):
+        for entry in os.scandir(directory):
+            if not entry.is_file():
+                continue
+            st = entry.stat()
+            if entry.name.startswith('.incoming-') or entry.name.endswith('.tmp'):
+                if now - st.st_mtime > INCOMING_MAX_AGE:
+                    removed += _remove(entry.path)
+                continue
+            if _DIGEST_RE.match(entry.name):
+                files.append((st.st_mtime, st.st_size, entry.path))
+
+    files.sort()
+    total = sum(size for _, size, _ in files)
+    # Held while removing, so a blob cannot be pinned between the check and the delete
+    with _pin_lock:
+        for mtime, size, path in files:
+            if now - mtime <= STORAGE_MAX_AGE and total <= STORAGE_MAX_BYTES:
+                break
+            if path in _pins:
+                continue
+            removed += _remove(path)
+            total -= size
+    return removed
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+        return 1
+    except FileNotFoundError:
+        return 0
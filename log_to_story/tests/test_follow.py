@@ -0,0 +1,41 @@
+from datetime import datetime, timedelta
+
+from follow import LogFollower
+from parser import analyze_findings, parse_path
+
+
+def _line(ts, text):
+    return f"{ts:%b} {ts.day:2d} {ts:%H:%M:%S} web sshd[1]: {text}\n"
+
+
+def _key(f):
+    return f['type'], f.get('target') or f.get('ip'), f.get('count') or f.get('fail_count'), \
+        f.get('start_ts') or f.get('success_ts'), f.get('end_ts')
+
+
+def test_lagging_timestamps_match_analyze_findings(tmp_path):
+    # An hour behind the wall clock, as a replayed backlog or journald in UTC
+    # east of Greenwich would be; one line per poll
+    base = (datetime.now() - timedelta(hours=1)).replace(microsecond=0)
+    lines = [_line(base + timedelta(seconds=3 * n), f"Failed password for oracle from 198.51.100.75 port {4000 + n} ssh2")
+             for n in range(8)]
+    lines.append(_line(base + timedelta(seconds=30), "Accepted password for oracle from 198.51.100.75 port 4100 ssh2"))
+    lines += [_line(base + timedelta(minutes=20, seconds=n), f"Failed password for invalid user admin from 203.0.113.9 port {5000 + n} ssh2")
+              for n in range(6)]
+
+    path = tmp_path / 'auth.log'
+    path.write_text('')
+    follower = LogFollower(str(path))
+    found = []
+    try:
+        for line in lines:
+            with open(path, 'a') as f:
+                f.write(line)
+            found.extend(follower.poll())
+        found.extend(follower.detector.flush())
+    finally:
+        follower.close()
+
+    expected = analyze_findings(parse_path(str(path)))
+    assert sorted(map(_key, found)) == sorted(map(_key, expected))
+    assert {f['count'] for f in found if f['type'] == 'brute_force' and f['target'] == '198.51.100.75'} == {8}
@@ -0,0 +1,39 @@
+import asyncio
+import json
+
+import httpx
+
+import gemini_client
+
+FIRST = "Brute force from 203.0.113.9 (6 attempts) between 2024-02-06 08:30:15 and 2024-02-06 08:31:02"
+SECOND = "Brute force from 203.0.113.9 (6 attempts) between 2024-03-11 22:04:40 and 2024-03-11 22:05:27"
+
+
+def test_cache_key_keeps_timestamps():
+    assert gemini_client.cache_key(FIRST) != gemini_client.cache_key(SECOND)
+    assert gemini_client.cache_key(f"  {FIRST}\n\nother") == gemini_client.cache_key(f"other\n{FIRST}")
+
+
+def test_prompts_differing_only_in_time_get_their_own_narrative(monkeypatch):
+    calls = []
+
+    def handler(request):
+        prompt = json.loads(request.content)['contents'][0]['parts'][0]['text'].split('Findings:\n', 1)[1]
+        calls.append(prompt)
+        return httpx.Response(200, json={'candidates': [{'content': {'parts': [{'text': f"Story: {prompt}"}]}}]})
+
+    async def run():
+        gemini_client._client = httpx.AsyncClient(base_url='http://gemini.test', transport=httpx.MockTransport(handler))
+        try:
+            return [await gemini_client.agenerate_narrative(p) for p in (FIRST, SECOND, FIRST)]
+        finally:
+            await gemini_client.aclose()
+
+    monkeypatch.setattr(gemini_client, 'GEMINI_API_KEY', 'test')
+    monkeypatch.setattr(gemini_client, '_cache', type(gemini_client._cache)())
+    monkeypatch.setattr(gemini_client, '_semaphore', None)
+    first, second, again = asyncio.run(run())
+    assert first == f"Story: {FIRST}"
+    assert second == f"Story: {SECOND}"
+    assert again == first
+    assert calls == [FIRST, SECOND]
@@ -0,0 +1,27 @@
+from datetime import datetime, timedelta
+
+import parser
+
+
+def test_parallel_parse_keeps_log_order(tmp_path, monkeypatch):
+    # Out-of-order lines and many sharing a second, split across ranges
+    base = datetime(2024, 3, 2, 12)
+    lines = []
+    for n in range(20000):
+        ts = base + timedelta(seconds=n // 4 - (30 if n % 7 == 0 else 0))
+        lines.append(f"{ts:%b} {ts.day:2d} {ts:%H:%M:%S} web sshd[1]: "
+                     f"Failed password for u{n % 50} from 10.0.{n % 7}.{n % 200} port {n} ssh2\n")
+    path = tmp_path / 'auth.log'
+    path.write_text(''.join(lines))
+    monkeypatch.setattr(parser, 'PARALLEL_MIN_CHUNK', 64 * 1024)
+
+    serial = parser.parse_mapped(str(path))
+    try:
+        parallel = parser.parse_file_parallel(str(path), workers=4)
+    finally:
+        parser.shutdown_pool()
+
+    a, b = serial['events'], parallel['events']
+    assert list(a.ts) == list(b.ts)
+    assert [a.user(i) for i in range(len(a))] == [b.user(i) for i in range(len(b))]
+    assert serial['summary'] == parallel['summary']
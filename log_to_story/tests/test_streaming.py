@@ -0,0 +1,31 @@
+import os
+
+from fastapi.testclient import TestClient
+
+import main
+
+DEMO_LOG = os.path.join(os.path.dirname(main.__file__), 'demo_auth.txt')
+
+
+def _analyze(client, path):
+    with open(DEMO_LOG, 'rb') as f:
+        return client.post(path, files={'logfile': ('demo_auth.txt', f)}, headers={'Accept-Encoding': 'gzip'})
+
+
+def test_streams_are_not_gzipped():
+    with TestClient(main.app) as client:
+        r = _analyze(client, '/analyze/stream')
+        assert r.status_code == 200
+        assert r.headers['content-type'].startswith('text/event-stream')
+        assert 'content-encoding' not in r.headers
+        assert 'event: result' in r.text
+
+        analysis_id = _analyze(client, '/analyze').json()['id']
+        r = client.get(f'/analysis/{analysis_id}/events/stream', headers={'Accept-Encoding': 'gzip'})
+        assert r.status_code == 200
+        assert 'content-encoding' not in r.headers
+        assert len(r.text.splitlines()) > 1
+
+        # Large JSON bodies are still compressed
+        r = client.get(f'/analysis/{analysis_id}/events', params={'limit': 100}, headers={'Accept-Encoding': 'gzip'})
+        assert r.headers.get('content-encoding') == 'gzip'